@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Offline benchmarks for each stage of drawing a profile image.
+
+The Steam API is replaced by the recorded profiles in fixtures/profiles.json and
+the CDN by a local HTTP server for the images in fixtures/assets, so results
+only depend on this machine. Every stage is timed on its own for the card and
+sig imgtypes and the results are written as JSON:
+
+    python benchmarks/bench.py -n 50 -o results-1.0.4.json
+    python benchmarks/bench.py --compare results-1.0.3.json results-1.0.4.json
+"""
+import sys
+
+if sys.version_info[0] == 3:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+else:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+import json, optparse, os, platform, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from PIL import ImageDraw
+from steamwebapi import profiles
+
+import steamprofilecard
+from steamprofilecard import encoders, sprites
+from steamprofilecard.assets import AssetFetcher
+from steamprofilecard.cache import image_cache, profile_cache, render_cache, sprite_cache, composition_cache, text_cache
+from steamprofilecard.layout import compileLayout, clearLayouts, profileFields
+from steamprofilecard.resources import resources
+from steamprofilecard.steamprofilecard import SteamProfileCard
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+IMGSIZES = {'card': (210, 150), 'sig': (350, 50)}
+
+class AssetHandler(SimpleHTTPRequestHandler):
+    def translate_path(self, path):
+        return os.path.join(FIXTURES, "assets", os.path.basename(path.split("?")[0]))
+
+    def log_message(self, *args):
+        pass
+
+class AssetServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def localUrl(url, port):
+    return "http://127.0.0.1:%d/%s" % (port, os.path.basename(url))
+
+def loadFixtures(port):
+    """
+    Returns the recorded profiles as steamwebapi User and Group objects keyed by
+    steamuserid, with every image url pointing at the local asset server.
+    """
+    with open(os.path.join(FIXTURES, "profiles.json")) as f:
+        recorded = json.load(f)
+    fixtures = {}
+    for steamuserid, data in recorded.items():
+        user = profiles.User()
+        for key, value in data['user'].items():
+            setattr(user, key, value)
+        user.avatarmedium = localUrl(user.avatarmedium, port)
+        for game in user.recentlyplayedgames:
+            game['img_icon_url'] = localUrl(game['img_icon_url'], port)
+        group = None
+        if data['group']:
+            group = profiles.Group()
+            for key, value in data['group'].items():
+                setattr(group, key, value)
+            group.avataricon = localUrl(group.avataricon, port)
+        fixtures[steamuserid] = (user, group)
+    return fixtures
+
+def installFixtures(fixtures):
+    byclan = dict((user.primaryclanid, group) for user, group in fixtures.values() if group)
+    profiles.get_user_profile = lambda steamuserid, steam_api_key=None: fixtures[steamuserid][0]
+    profiles.get_group_profile = lambda clanid, steam_api_key=None: byclan[clanid]
+
+def clearCaches():
+    for cache in (image_cache, profile_cache, render_cache, sprite_cache, composition_cache, text_cache):
+        cache.clear()
+
+def timeit(func, iterations, setup=None):
+    """
+    Runs func iterations times, calling setup untimed before each run. Returns
+    the timings in milliseconds.
+    """
+    timings = []
+    for i in range(iterations):
+        if setup:
+            setup()
+        start = time.time()
+        func()
+        timings.append((time.time() - start) * 1000.0)
+    return timings
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'min_ms': round(timings[0], 4),
+        'median_ms': round(timings[len(timings) // 2], 4),
+        'mean_ms': round(sum(timings) / len(timings), 4),
+        'max_ms': round(timings[-1], 4),
+        'iterations': len(timings),
+    }
+
+def benchImgtype(imgtype, steamuserids, iterations):
+    """
+    Returns a dict of stage name to timing summary for one imgtype, summed over
+    every fixture profile per iteration.
+    """
+    size = IMGSIZES[imgtype]
+    stages = {}
+
+    def profileLoad():
+        for steamuserid in steamuserids:
+            SteamProfileCard(steamuserid, imgtype, "default")
+    stages['profile_load'] = timeit(profileLoad, iterations, profile_cache.clear)
+
+    # Private profiles only get the error image, so they are left out of the layout stages.
+    cards = [SteamProfileCard(steamuserid, imgtype, "default") for steamuserid in steamuserids]
+    cards = [card for card in cards if card.user_profile.communityvisibilitystate != "Private"]
+    layout = compileLayout(imgtype, "default", size)
+    fieldsets = [profileFields(card.user_profile, card.primary_group_profile) for card in cards]
+    requests = [layout.assetRequests(fields) for fields in fieldsets]
+
+    fetcher = AssetFetcher()
+    def assetFetch():
+        for request in requests:
+            fetcher.fetch([url for url, size in request])
+    stages['asset_fetch'] = timeit(assetFetch, iterations)
+
+    def assetLoad():
+        for card in cards:
+            card.prefetchAssets()
+    stages['asset_decode'] = timeit(assetLoad, iterations, image_cache.clear)
+    for card in cards:
+        card.prefetchAssets()
+    assetsets = [dict(((url, size), image_cache.getImage(url, size)) for url, size in request) for request in requests]
+
+    stages['template_load_cold'] = timeit(lambda: resources.template(imgtype, "default", size), iterations, resources.clear)
+    stages['template_load'] = timeit(lambda: resources.template(imgtype, "default", size), iterations)
+
+    def drawSprites():
+        for fields in fieldsets:
+            sprites.onlineState("#00FF00")
+            sprites.steamLevel(str(fields['steamlevel']))
+    stages['status_level_cold'] = timeit(drawSprites, iterations, sprite_cache.clear)
+    stages['status_level'] = timeit(drawSprites, iterations)
+
+    def drawText():
+        for fields in fieldsets:
+            image = layout.base.copy()
+            draw = ImageDraw.Draw(image)
+            for element in layout.visible(fields):
+                if element['type'] == 'text':
+                    layout.drawElement(image, draw, element, fields, {})
+    stages['text_cold'] = timeit(drawText, iterations, text_cache.clear)
+    stages['text'] = timeit(drawText, iterations)
+
+    def compose():
+        for fields, assets in zip(fieldsets, assetsets):
+            layout.render(fields, assets)
+    stages['compose'] = timeit(compose, iterations)
+
+    compositions = [layout.renderIncremental(fields, assets) for fields, assets in zip(fieldsets, assetsets)]
+    def composeIncremental():
+        for fields, assets, previous in zip(fieldsets, assetsets, compositions):
+            changed = dict(fields)
+            changed['personastate'] = "Busy" if fields['personastate'] != "Busy" else "Online"
+            layout.renderIncremental(changed, assets, previous)
+    stages['compose_incremental'] = timeit(composeIncremental, iterations)
+
+    images = [layout.render(fields, assets) for fields, assets in zip(fieldsets, assetsets)]
+    for format in ("png", "png-palette"):
+        stages['encode_%s' % format.replace("-", "_")] = timeit(lambda: [encoders.encode(image, format) for image in images], iterations)
+    stages['encoded_bytes'] = [sum(encoders.encode(image).size for image in images)]
+
+    def coldRender():
+        for steamuserid in steamuserids:
+            SteamProfileCard(steamuserid, imgtype, "default").renderToWeb()
+    stages['render_cold'] = timeit(coldRender, iterations, clearCaches)
+    def warmRender():
+        for steamuserid in steamuserids:
+            SteamProfileCard(steamuserid, imgtype, "default").renderToWeb()
+    stages['render_warm'] = timeit(warmRender, iterations)
+
+    results = {}
+    for name, timings in stages.items():
+        if name == 'encoded_bytes':
+            results[name] = timings[0]
+        else:
+            results[name] = summarize(timings)
+    return results
+
+def runBenchmarks(iterations):
+    server = AssetServer(("127.0.0.1", 0), AssetHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    saved = (profiles.get_user_profile, profiles.get_group_profile)
+    try:
+        fixtures = loadFixtures(server.server_address[1])
+        installFixtures(fixtures)
+        steamuserids = sorted(fixtures)
+        clearCaches()
+        clearLayouts()
+        results = {
+            'version': steamprofilecard.__version__,
+            'python': platform.python_version(),
+            'pillow': getattr(PIL, '__version__', getattr(PIL, 'PILLOW_VERSION', "unknown")),
+            'platform': platform.platform(),
+            'timestamp': int(time.time()),
+            'profiles': len(steamuserids),
+            'stages': {},
+        }
+        for imgtype in ("card", "sig"):
+            results['stages'][imgtype] = benchImgtype(imgtype, steamuserids, iterations)
+        return results
+    finally:
+        profiles.get_user_profile, profiles.get_group_profile = saved
+        server.shutdown()
+        server.server_close()
+
+def compare(old, new):
+    """
+    Returns lines comparing the median of every stage in two result files.
+    """
+    lines = ["%-8s %-22s %12s %12s %8s" % ("imgtype", "stage", "old ms", "new ms", "change")]
+    for imgtype in sorted(new['stages']):
+        for stage in sorted(new['stages'][imgtype]):
+            newstage = new['stages'][imgtype][stage]
+            oldstage = old['stages'].get(imgtype, {}).get(stage)
+            if not isinstance(newstage, dict) or not isinstance(oldstage, dict):
+                continue
+            change = ""
+            if oldstage['median_ms']:
+                change = "%+.1f%%" % ((newstage['median_ms'] / oldstage['median_ms'] - 1) * 100)
+            lines.append("%-8s %-22s %12.3f %12.3f %8s" % (imgtype, stage, oldstage['median_ms'], newstage['median_ms'], change))
+    return lines
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="%prog [options]\n       %prog --compare OLD.json NEW.json",
+                                   description="Benchmark the SteamProfileCard render path offline.")
+    parser.add_option("-n", "--iterations", type="int", default=20, help="runs per stage [%default]")
+    parser.add_option("-o", "--output", help="write the JSON results to FILE instead of stdout")
+    parser.add_option("--compare", action="store_true", help="compare two result files")
+    options, args = parser.parse_args(argv)
+    if options.compare:
+        if len(args) != 2:
+            parser.error("--compare needs two result files")
+        with open(args[0]) as f:
+            old = json.load(f)
+        with open(args[1]) as f:
+            new = json.load(f)
+        print("\n".join(compare(old, new)))
+        return 0
+
+    results = json.dumps(runBenchmarks(options.iterations), indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(results + "\n")
+    else:
+        print(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
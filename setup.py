@@ -43,6 +43,12 @@ setup(name='steamprofilecard',
       license='GNU GPL v3',
       platforms='Unix, Windows',
       test_suite='steamprofilecard.test',
+      entry_points={
+            'console_scripts': [
+                  'steamprofilecard-batch = steamprofilecard.batch:main',
+                  'steamprofilecard-server = steamprofilecard.server:main',
+            ],
+      },
       classifiers=[
             'Development Status :: 4 - Beta',
 
@@ -0,0 +1,190 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+An asyncio interface to SteamProfileCard, for Python 3.5 and later:
+
+    card = await AsyncSteamProfileCard.create("vanityURL", "card", "default", session=session)
+    data = await card.render()
+
+Assets are downloaded on the event loop with aiohttp if it is installed. Pass
+one aiohttp.ClientSession for all cards so connections are reused. Without
+aiohttp the downloads run in the executor instead. Profile lookups that miss
+the profile cache, decoding and drawing always run in the executor, so the
+event loop only waits.
+
+This module isn't imported by the package so Python 2 can still use the rest.
+"""
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError("steamprofilecard.aio requires Python 3.5 or later")
+
+import asyncio, functools, time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from steamprofilecard.assets import AssetFetcher, ASSET_TIMEOUT
+from steamprofilecard.cache import image_cache, profile_cache
+from steamprofilecard.instrument import Event, instrumentation
+from steamprofilecard.layout import compileLayout, profileFields
+from steamprofilecard.sources import steam_source
+from steamprofilecard.steamprofilecard import SteamProfileCard
+
+async def _download(session, url):
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return await response.read()
+
+async def fetchAssets(urls, timeout=ASSET_TIMEOUT, session=None, executor=None):
+    """
+    Downloads every url at once and waits at most timeout seconds for all of
+    them. Returns a dict of url to raw bytes holding only the assets that
+    finished in time, like AssetFetcher.fetch(). Uses session, or a session
+    for just this call, if aiohttp is installed and the executor otherwise.
+    """
+    urls = list(set(url for url in urls if url))
+    if not urls:
+        return {}
+    if aiohttp is None and session is None:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, AssetFetcher(timeout).fetch, urls)
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await fetchAssets(urls, timeout, session, executor)
+
+    start = time.time()
+    tasks = dict((asyncio.ensure_future(_download(session, url)), url) for url in urls)
+    done, pending = await asyncio.wait(list(tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    results = {}
+    events = []
+    for task in done:
+        url = tasks[task]
+        error = task.exception()
+        if error is None:
+            results[url] = task.result()
+            events.append(Event("asset_fetch", time.time() - start, len(results[url]), "ok", None, {'url': url}))
+        else:
+            events.append(Event("asset_fetch", time.time() - start, 0, "error",
+                                "%s: %s" % (type(error).__name__, error), {'url': url}))
+    for task in pending:
+        events.append(Event("asset_fetch", time.time() - start, 0, "timeout", None, {'url': tasks[task]}))
+    if instrumentation.enabled():
+        for event in events:
+            instrumentation.emit(event)
+    return results
+
+def _missingAssets(requests):
+    """
+    Returns the urls in requests that aren't in the image cache.
+    """
+    return [url for url, size in requests if url and image_cache.getImage(url, size) is None]
+
+class _Downloaded:
+    """
+    Stands in for the AssetFetcher of a card whose assets were already
+    downloaded, so drawing it never blocks on the network.
+    """
+    def __init__(self, downloads, timeout):
+        self.downloads = downloads
+        self.timeout = timeout
+
+    def fetch(self, urls):
+        return dict((url, self.downloads[url]) for url in urls if url in self.downloads)
+
+class AsyncSteamProfileCard:
+    def __init__(self, card, session=None, executor=None):
+        """
+        Wraps a SteamProfileCard, available as self.card for fingerprint(), etag()
+        and the other methods that don't block. Use create() instead.
+        """
+        self.card = card
+        self.session = session
+        self.executor = executor
+
+    @classmethod
+    async def create(cls, steamuserid, imgtype, template, asset_timeout=ASSET_TIMEOUT, session=None, executor=None,
+                     source=None):
+        """
+        Looks up the profile and returns an AsyncSteamProfileCard. session is an
+        aiohttp.ClientSession used for the asset downloads and executor the
+        concurrent.futures executor for the blocking work, the loop's default if
+        None. With a source other than Steam, see steamprofilecard.sources, the
+        assets are asked for from it in the executor.
+        """
+        if not (source or steam_source).bypass_cache and profile_cache.usable(steamuserid):
+            # Cached profiles are returned without a lookup, stale ones are
+            # refreshed on a background thread. Expired ones, and every profile
+            # of a source that bypasses the cache, are looked up again.
+            card = SteamProfileCard(steamuserid, imgtype, template, asset_timeout, source)
+        else:
+            loop = asyncio.get_event_loop()
+            card = await loop.run_in_executor(executor, SteamProfileCard, steamuserid, imgtype, template, asset_timeout,
+                                              source)
+        return cls(card, session, executor)
+
+    async def prefetchAssets(self):
+        """
+        Downloads the assets the profile needs that aren't in the image cache.
+        Returns a dict of url to raw bytes of the downloads.
+        """
+        card = self.card
+        downloads = {}
+        if card.profileGrabStatus and not card.user_profile.communityvisibilitystate == "Private":
+            layout = compileLayout(card.imgtype, card.template, card.imgsize)
+            requests = layout.assetRequests(profileFields(card.user_profile, card.primary_group_profile))
+            if card.source.bypass_cache:
+                missing = [url for url, size in requests if url]
+            elif image_cache.cache_dir:
+                loop = asyncio.get_event_loop()
+                missing = await loop.run_in_executor(self.executor, _missingAssets, requests)
+            else:
+                missing = _missingAssets(requests)
+            if card.source is steam_source:
+                downloads = await fetchAssets(missing, card.assetFetcher.timeout, self.session, self.executor)
+            else:
+                loop = asyncio.get_event_loop()
+                downloads = await loop.run_in_executor(self.executor, card.assetFetcher.fetch, missing)
+        card.assetFetcher = _Downloaded(downloads, card.assetFetcher.timeout)
+        return downloads
+
+    async def drawProfileImg(self):
+        """
+        Returns the drawn PIL image, see SteamProfileCard.drawProfileImg().
+        """
+        await self.prefetchAssets()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.card.drawProfileImg)
+
+    async def render(self, format="png", **options):
+        """
+        Returns the encoded image like SteamProfileCard.renderToWeb(). A render
+        cache hit is returned straight away, otherwise the assets are downloaded
+        and the image is drawn and encoded in the executor.
+        """
+        data = self.card.cachedRender(format, **options)
+        if data is not None:
+            return data
+        await self.prefetchAssets()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.card.renderToWeb, format, **options))
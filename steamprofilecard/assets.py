@@ -0,0 +1,101 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+import socket, threading, time
+
+from steamprofilecard.connpool import asset_pool
+from steamprofilecard.instrument import Event, instrumentation
+
+# Seconds allowed for every asset of a single card to arrive.
+ASSET_TIMEOUT = 5
+
+class AssetFetcher:
+    def __init__(self, timeout=ASSET_TIMEOUT, pool=None, source=None):
+        """
+        Downloads through pool, a steamprofilecard.connpool.ConnectionPool, which
+        defaults to the shared asset_pool so connections to the CDN are reused.
+        If source, a steamprofilecard.sources.DataSource, is given the assets
+        are asked for from it instead.
+        """
+        self.timeout = timeout
+        self.pool = pool or asset_pool
+        self.source = source
+
+    def __download(self, url, results, pending, lock):
+        """
+        Downloads a single url and stores the raw bytes in results. Failures are
+        left out of results so the drawing code can skip that asset, and are
+        reported to the instrumentation along with the successful downloads.
+        Downloads that finish after fetch() gave up on them are not reported again.
+        """
+        start = time.time()
+        data, error, outcome = None, None, "ok"
+        try:
+            if self.source is not None:
+                data = self.source.getAsset(url, self.timeout)
+            else:
+                data = self.pool.get(url, timeout=self.timeout)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            if isinstance(e, socket.timeout):
+                outcome = "timeout"
+            else:
+                outcome = "error"
+        with lock:
+            if url not in pending:
+                return
+            pending.discard(url)
+            if error is None:
+                results[url] = data
+        if instrumentation.enabled():
+            nbytes = len(data) if data is not None else 0
+            instrumentation.emit(Event("asset_fetch", time.time() - start, nbytes, outcome, error, {'url': url}))
+
+    def fetch(self, urls):
+        """
+        Starts a download for every url at once and waits at most self.timeout
+        seconds for all of them. Returns a dict of url to raw bytes holding only
+        the assets that finished in time. Downloads still running after the
+        deadline are abandoned.
+        """
+        results = {}
+        pending = set(url for url in urls if url)
+        lock = threading.Lock()
+        threads = []
+        for url in list(pending):
+            thread = threading.Thread(target=self.__download, args=(url, results, pending, lock))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        start = time.time()
+        deadline = start + self.timeout
+        for thread in threads:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            thread.join(remaining)
+
+        with lock:
+            abandoned = list(pending)
+            pending.clear()
+            results = dict(results)
+        if instrumentation.enabled():
+            for url in abandoned:
+                instrumentation.emit(Event("asset_fetch", time.time() - start, 0, "timeout", None, {'url': url}))
+        return results
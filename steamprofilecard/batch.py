@@ -0,0 +1,235 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Renders profile images for many Steam users at once on a pool of worker
+processes, writing them to a directory or a zip archive.
+"""
+import multiprocessing, optparse, os, re, shutil, sys, tempfile, zipfile
+
+from steamprofilecard import memory
+from steamprofilecard.assets import ASSET_TIMEOUT
+from steamprofilecard.cache import image_cache
+from steamprofilecard.sources import ReplaySource
+from steamprofilecard.steamprofilecard import SteamProfileCard
+
+IMGTYPES = ("card", "sig")
+
+class DirectoryWriter:
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+class ZipWriter:
+    def __init__(self, path):
+        # PNG data is already compressed, so the entries are only stored.
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.archive.writestr(name, data)
+
+    def close(self):
+        self.archive.close()
+
+def openWriter(output):
+    """
+    Returns a ZipWriter if output ends in .zip, otherwise a DirectoryWriter.
+    """
+    if output.lower().endswith(".zip"):
+        return ZipWriter(output)
+    return DirectoryWriter(output)
+
+def outputName(steamuserid, imgtype):
+    """
+    Returns the file name used for a rendered image, with anything that isn't
+    safe in a file name replaced.
+    """
+    return "%s_%s.png" % (re.sub(r"[^A-Za-z0-9_.-]", "_", steamuserid), imgtype)
+
+# The DataSource of this worker process, set by _initWorker().
+_source = None
+
+def _initWorker(cache_dir, memory_limit=None, source=None):
+    global _source
+    _source = source
+    # Workers share downloaded assets through the disk tier of the image cache.
+    if cache_dir:
+        image_cache.cache_dir = cache_dir
+    if memory_limit:
+        memory.install(memory.MemoryGovernor(memory_limit))
+
+def _saveWorkerState():
+    """
+    Returns what _initWorker() changes in this process, for _restoreWorkerState().
+    """
+    return _source, image_cache.cache_dir, memory.governor, memory.cacheSizes()
+
+def _restoreWorkerState(state):
+    global _source
+    _source, image_cache.cache_dir, governor, sizes = state
+    if governor is None:
+        memory.uninstall()
+    else:
+        memory.install(governor)
+    memory.resizeCaches(sizes)
+
+def _renderUser(task):
+    """
+    Renders every imgtype for one user inside a worker. All imgtypes of a user go
+    to the same worker so the profile is only looked up once. Returns the
+    steamuserid and a list of (imgtype, data, error) with exactly one of data
+    and error set, so one failing profile never stops the batch.
+    """
+    steamuserid, imgtypes, template, asset_timeout = task
+    results = []
+    for imgtype in imgtypes:
+        try:
+            profile = SteamProfileCard(steamuserid, imgtype, template, asset_timeout, _source)
+            if profile.profileGrabStatus == False:
+                raise RuntimeError("error retrieving the Steam profile")
+            data = profile.renderToWeb()
+            if not data:
+                raise RuntimeError("error encoding the image")
+            results.append((imgtype, data, None))
+        except Exception as e:
+            results.append((imgtype, None, str(e)))
+    return steamuserid, results
+
+def renderBatch(steamuserids, output, imgtypes=IMGTYPES, template="default", processes=None,
+                progress=None, cache_dir=None, asset_timeout=ASSET_TIMEOUT, memory_limit=None,
+                source=None):
+    """
+    Renders imgtypes for every id in steamuserids on a pool of processes worker
+    processes (default is one per core) and writes the PNGs to output, which is a
+    directory or a .zip file. Duplicate ids are only rendered once. If given,
+    progress(done, total, steamuserid, errors) is called after each user.
+    Workers share downloaded assets through the disk tier of the image cache
+    in cache_dir, a temporary directory removed afterwards by default. With
+    processes=1 the batch runs in this process, which gets its caches and
+    memory governor back when it is done. memory_limit caps the caches of every worker at that many
+    bytes, see steamprofilecard.memory. source is the DataSource profiles and
+    assets come from, see steamprofilecard.sources; every worker gets its own
+    copy. Returns a dict with the number of images written and a list of
+    (steamuserid, imgtype, error) for those that failed.
+    """
+    tasks = []
+    seen = set()
+    for steamuserid in steamuserids:
+        if steamuserid not in seen:
+            seen.add(steamuserid)
+            tasks.append((steamuserid, tuple(imgtypes), template, asset_timeout))
+
+    writer = openWriter(output)
+    summary = {'rendered': 0, 'failed': []}
+    pool = None
+    saved = None
+    tmpdir = None
+    if processes == 1:
+        # The memory tier already shares assets within this process.
+        saved = _saveWorkerState()
+        _initWorker(cache_dir, memory_limit, source)
+        results = map(_renderUser, tasks)
+    else:
+        if not cache_dir:
+            cache_dir = tmpdir = tempfile.mkdtemp(prefix="steamprofilecard-")
+        pool = multiprocessing.Pool(processes, _initWorker, (cache_dir, memory_limit, source))
+        results = pool.imap_unordered(_renderUser, tasks)
+    try:
+        for done, (steamuserid, images) in enumerate(results, 1):
+            errors = []
+            for imgtype, data, error in images:
+                if error is None:
+                    writer.write(outputName(steamuserid, imgtype), data)
+                    summary['rendered'] += 1
+                else:
+                    errors.append((steamuserid, imgtype, error))
+            summary['failed'].extend(errors)
+            if progress:
+                progress(done, len(tasks), steamuserid, errors)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if saved is not None:
+            _restoreWorkerState(saved)
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    return summary
+
+def readIds(filename):
+    """
+    Reads one steamuserid per line from filename, or stdin for "-". Blank lines and
+    lines starting with # are skipped.
+    """
+    if filename == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(filename) as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="%prog [options] [steamuserid ...]",
+                                   description="Render Steam profile cards and signatures for many users.")
+    parser.add_option("-f", "--file", help="read ids from FILE, one per line ('-' for stdin)")
+    parser.add_option("-o", "--output", default="profilecards", help="output directory or .zip archive [%default]")
+    parser.add_option("-t", "--type", dest="imgtypes", action="append", choices=IMGTYPES,
+                      help="image type to render, card or sig; may be repeated [both]")
+    parser.add_option("--template", default="default", help="template name [%default]")
+    parser.add_option("-j", "--processes", type="int", help="worker processes [one per core]")
+    parser.add_option("--cache-dir", help="share downloaded assets between workers through DIR [a temporary directory]")
+    parser.add_option("--timeout", type="float", default=ASSET_TIMEOUT, help="asset download timeout in seconds [%default]")
+    parser.add_option("--memory-limit", type="int", metavar="MB", help="memory budget of each worker's caches")
+    parser.add_option("--replay", metavar="ARCHIVE", help="answer from a recorded fixture archive instead of Steam")
+    parser.add_option("--latency", type="float", default=0, help="seconds added to every replayed call [%default]")
+    parser.add_option("--error-rate", type="float", default=0, help="share of replayed calls that fail [%default]")
+    parser.add_option("-q", "--quiet", action="store_true", help="don't report progress")
+    options, steamuserids = parser.parse_args(argv)
+    if options.file:
+        steamuserids.extend(readIds(options.file))
+    if not steamuserids:
+        parser.error("no steamuserids given")
+
+    source = None
+    if options.replay:
+        source = ReplaySource(options.replay, options.latency, error_rate=options.error_rate)
+
+    def report(done, total, steamuserid, errors):
+        for failed, imgtype, error in errors:
+            sys.stderr.write("%s %s failed: %s\n" % (failed, imgtype, error))
+        if not options.quiet:
+            sys.stderr.write("[%d/%d] %s\n" % (done, total, steamuserid))
+
+    summary = renderBatch(steamuserids, options.output, options.imgtypes or IMGTYPES, options.template,
+                          options.processes, report, options.cache_dir, options.timeout,
+                          options.memory_limit and options.memory_limit * 1024 * 1024, source)
+    if not options.quiet:
+        sys.stderr.write("%d images written to %s, %d failed\n" % (summary['rendered'], options.output, len(summary['failed'])))
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
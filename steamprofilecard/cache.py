@@ -0,0 +1,366 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+import hashlib, heapq, os, threading, time
+from PIL import Image
+
+from steamprofilecard.instrument import instrumentation
+
+class LRUCache:
+    def __init__(self, max_bytes, ttl=None):
+        """
+        A thread safe least recently used cache. Entries are evicted once the sum
+        of their sizes goes over max_bytes, or once they are older than ttl seconds.
+        A ttl of None keeps entries until they are evicted for space.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        # key to (value, nbytes, stored, tick), tick counting up on every use.
+        # The heap holds (tick, key) and items that no longer match are skipped.
+        self._entries = {}
+        self._order = []
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, stored):
+        return self.ttl is not None and time.time() - stored > self.ttl
+
+    def _put(self, key, value, nbytes, stored):
+        """
+        Stores an entry as the most recently used. Must be called with the lock held.
+        """
+        self._tick += 1
+        self._entries[key] = (value, nbytes, stored, self._tick)
+        heapq.heappush(self._order, (self._tick, key))
+        if len(self._order) > 2 * len(self._entries) + 64:
+            self._order = [(entry[3], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._order)
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the cache fits max_bytes.
+        Must be called with the lock held.
+        """
+        while self.size > self.max_bytes and self._entries:
+            tick, key = heapq.heappop(self._order)
+            entry = self._entries.get(key)
+            if entry is None or entry[3] != tick:
+                continue
+            del self._entries[key]
+            self.size -= entry[1]
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[2]):
+                if entry is not None:
+                    del self._entries[key]
+                    self.size -= entry[1]
+                self.misses += 1
+                return default
+            self._put(key, entry[0], entry[1], entry[2])
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, nbytes):
+        """
+        Stores value under key, counting nbytes against max_bytes. Values larger
+        than the whole budget are not stored.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._put(key, value, nbytes, time.time())
+            self.size += nbytes
+            self._evict()
+
+    def resize(self, max_bytes):
+        """
+        Changes max_bytes, evicting the least recently used entries that no longer fit.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._order = []
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns a dict of counters that can be used to tune the cache budget.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
+
+class ImageCache(LRUCache):
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=24 * 60 * 60, cache_dir=None):
+        """
+        Caches decoded, already resized PIL images keyed by (url, size). If cache_dir
+        is set, images are also written there as PNG files so they survive a
+        restart. Files on disk follow the same ttl as the memory tier.
+        """
+        LRUCache.__init__(self, max_bytes, ttl)
+        self.cache_dir = cache_dir
+        self.disk_hits = 0
+
+    def _path(self, key):
+        url, size = key
+        digest = hashlib.sha1(("%s|%s" % (url, size)).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".png")
+
+    def _nbytes(self, image):
+        return image.size[0] * image.size[1] * len(image.getbands())
+
+    def _readDisk(self, key):
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                image = Image.open(f)
+                image.load()
+        except Exception:
+            return None
+        return image
+
+    def _writeDisk(self, key, image):
+        path = self._path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # Write to a temporary file first so readers never see half an image.
+            tmppath = "%s.%s.tmp" % (path, threading.current_thread().ident)
+            with open(tmppath, 'wb') as f:
+                image.save(f, "PNG")
+            os.rename(tmppath, path)
+        except Exception:
+            pass
+
+    def getImage(self, url, size=None):
+        """
+        Returns the cached image for url at size, or None. The disk tier is only
+        checked after a miss in memory.
+        """
+        key = (url, size)
+        image = self.get(key)
+        if image is None and self.cache_dir:
+            image = self._readDisk(key)
+            if image is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                LRUCache.set(self, key, image, self._nbytes(image))
+        return image
+
+    def setImage(self, url, size, image):
+        """
+        Stores a decoded image for url at size in memory, and on disk if enabled.
+        """
+        key = (url, size)
+        LRUCache.set(self, key, image, self._nbytes(image))
+        if self.cache_dir:
+            self._writeDisk(key, image)
+
+    def stats(self):
+        stats = LRUCache.stats(self)
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+class _Flight:
+    """
+    A profile lookup in progress that other callers for the same key wait on.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ProfileCache:
+    def __init__(self, fresh=60, stale=300, max_profiles=10000):
+        """
+        Caches profile lookups keyed by steamuserid. Entries younger than fresh
+        seconds are returned as is. Entries up to stale seconds past that are
+        still returned, but a refresh is started in the background. Older
+        entries are loaded again before returning. Concurrent lookups for the
+        same key share a single call to the loader.
+        """
+        self.fresh = fresh
+        self.stale = stale
+        # Every profile counts as one byte, so the budget is a number of profiles.
+        self._entries = LRUCache(max_profiles)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _load(self, key, loader):
+        """
+        Calls loader for key unless another thread is already doing so, in which
+        case its result is used. Errors are raised to every waiting caller and
+        are not cached.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+        else:
+            try:
+                self.loads += 1
+                flight.value = loader(key)
+                self._entries.set(key, (flight.value, time.time()), 1)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _refresh(self, key, loader):
+        with self._lock:
+            if key in self._flights:
+                return
+        thread = threading.Thread(target=self._backgroundLoad, args=(key, loader))
+        thread.daemon = True
+        thread.start()
+
+    def _backgroundLoad(self, key, loader):
+        try:
+            with instrumentation.stage("profile", refresh="background"):
+                self._load(key, loader)
+        except Exception:
+            # Reported with the outcome "error". The stale entry keeps being
+            # served until a load succeeds.
+            pass
+
+    def get(self, key, loader):
+        """
+        Returns the profile data for key, calling loader(key) only when there is
+        no usable entry.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched = entry
+            age = time.time() - fetched
+            if age < self.fresh:
+                return value
+            if age < self.fresh + self.stale:
+                self._refresh(key, loader)
+                return value
+        return self._load(key, loader)
+
+    def usable(self, key):
+        """
+        Returns True if get(key) would return without calling the loader, that
+        is if the entry for key is fresh or within its stale window.
+        """
+        age = self.age(key)
+        return age is not None and age < self.fresh + self.stale
+
+    def age(self, key):
+        """
+        Returns how many seconds ago the entry for key was loaded, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return time.time() - entry[1]
+
+    def invalidate(self, key):
+        self._entries.delete(key)
+
+    @property
+    def max_profiles(self):
+        return self._entries.max_bytes
+
+    def resize(self, max_profiles):
+        self._entries.resize(max_profiles)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        stats = self._entries.stats()
+        stats['loads'] = self.loads
+        return stats
+
+class RenderCache(LRUCache):
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=None):
+        """
+        Caches encoded profile images keyed by the fingerprint of everything that
+        affects their pixels. No ttl is needed since a change in the inputs gives
+        a new fingerprint.
+        """
+        LRUCache.__init__(self, max_bytes, ttl)
+
+    def setRender(self, fingerprint, data):
+        self.set(fingerprint, data, len(data))
+
+class RenderStore(LRUCache):
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        Holds the images pre-rendered by a RefreshScheduler, keyed by imgtype and
+        steamuserid, as (etag, data, format, expires) where expires is when the
+        scheduler will replace it. Entries stay usable after that until replaced.
+        The etag is None for images drawn with assets missing.
+        """
+        LRUCache.__init__(self, max_bytes)
+
+    def setRender(self, imgtype, steamuserid, etag, data, format, expires):
+        self.set((imgtype, steamuserid), (etag, data, format, expires), len(data))
+
+    def getRender(self, imgtype, steamuserid):
+        return self.get((imgtype, steamuserid))
+
+# Process wide caches shared by every SteamProfileCard.
+image_cache = ImageCache()
+profile_cache = ProfileCache()
+render_cache = RenderCache()
+# The last composition drawn per profile, for incremental re-renders.
+composition_cache = LRUCache(16 * 1024 * 1024)
+# Status dots and Steam level badges only depend on their arguments.
+sprite_cache = LRUCache(2 * 1024 * 1024)
+# Rasterized text runs, one alpha mask per string and font.
+text_cache = LRUCache(4 * 1024 * 1024)
@@ -0,0 +1,233 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+A pool of keep-alive HTTP connections for downloading assets from the Steam CDN,
+so an icon doesn't pay for a new TCP and TLS handshake every time.
+"""
+import sys
+
+if sys.version_info[0] == 3:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import urljoin, urlsplit
+else:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urlparse import urljoin, urlsplit
+
+import os, socket, threading, time
+
+# Largest asset accepted. Avatars and icons are a few kilobytes.
+MAX_RESPONSE_BYTES = 2 * 1024 * 1024
+
+MAX_REDIRECTS = 5
+
+class FetchError(IOError):
+    """
+    Raised for responses that aren't a usable asset: an error status, too many
+    redirects or a body larger than the pool allows.
+    """
+
+class ConnectionPool:
+    def __init__(self, max_per_host=8, max_connections=64, timeout=5, idle_timeout=30,
+                 max_response_bytes=MAX_RESPONSE_BYTES):
+        """
+        Keeps at most max_per_host connections open to one host and max_connections
+        in total, busy or idle. Idle connections are closed after idle_timeout
+        seconds. timeout is the default for get(), in seconds, and applies to
+        waiting for a free connection as well as to each socket operation.
+        """
+        self.max_per_host = max_per_host
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_response_bytes = max_response_bytes
+        self._cond = threading.Condition(threading.Lock())
+        # (scheme, host, port) to the number of connections in use and to a
+        # list of (connection, time it was returned) that are idle.
+        self._active = {}
+        self._idle = {}
+        self._pid = os.getpid()
+        self.created = 0
+        self.reused = 0
+
+    def _open(self):
+        return sum(self._active.values()) + sum(len(idle) for idle in self._idle.values())
+
+    def _closeIdle(self, key=None, expired=None):
+        """
+        Closes idle connections of host key, or of every host, that were returned
+        before expired, or all of them if expired is None. Called with the lock held.
+        """
+        for host in ([key] if key is not None else list(self._idle)):
+            keep = []
+            for conn, returned in self._idle.get(host, []):
+                if expired is None or returned < expired:
+                    conn.close()
+                else:
+                    keep.append((conn, returned))
+            if keep:
+                self._idle[host] = keep
+            else:
+                self._idle.pop(host, None)
+
+    def _evictOther(self, key):
+        """
+        Closes the longest idle connection to a host other than key to make room.
+        Returns False if there is none. Called with the lock held.
+        """
+        oldest = None
+        for host, idle in self._idle.items():
+            if host != key and idle and (oldest is None or idle[0][1] < self._idle[oldest][0][1]):
+                oldest = host
+        if oldest is None:
+            return False
+        conn, returned = self._idle[oldest].pop(0)
+        conn.close()
+        if not self._idle[oldest]:
+            del self._idle[oldest]
+        return True
+
+    def _checkout(self, key, deadline):
+        """
+        Returns an idle connection to key, or None if the caller may open a new
+        one. Waits until deadline for one to free up.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                # A forked batch worker must not share sockets with its parent.
+                self._closeIdle()
+                self._active = {}
+                self._pid = os.getpid()
+            while True:
+                self._closeIdle(key, time.time() - self.idle_timeout)
+                idle = self._idle.get(key)
+                if idle:
+                    conn, returned = idle.pop()
+                    if not idle:
+                        del self._idle[key]
+                    self._active[key] = self._active.get(key, 0) + 1
+                    self.reused += 1
+                    return conn
+                if self._active.get(key, 0) < self.max_per_host and \
+                        (self._open() < self.max_connections or self._evictOther(key)):
+                    self._active[key] = self._active.get(key, 0) + 1
+                    self.created += 1
+                    return None
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise socket.timeout("timed out waiting for a connection to %s" % key[1])
+                self._cond.wait(remaining)
+
+    def _checkin(self, key, conn, reusable):
+        with self._cond:
+            if key in self._active:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+            if reusable and conn is not None:
+                self._idle.setdefault(key, []).append((conn, time.time()))
+            elif conn is not None:
+                conn.close()
+            self._cond.notify_all()
+
+    def _request(self, key, path, timeout, deadline):
+        """
+        Sends a GET for path to host key and returns (status, location, body).
+        A reused connection the server has closed in the meantime is replaced by a
+        new one once.
+        """
+        scheme, host, port = key
+        conn = self._checkout(key, deadline)
+        reused = conn is not None
+        while True:
+            try:
+                if conn is None:
+                    cls = HTTPSConnection if scheme == "https" else HTTPConnection
+                    conn = cls(host, port, timeout=timeout)
+                elif conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request("GET", path, headers={'Connection': "keep-alive"})
+                response = conn.getresponse()
+            except Exception as e:
+                if conn is not None:
+                    conn.close()
+                if reused and isinstance(e, (socket.error, HTTPException)) and not isinstance(e, socket.timeout):
+                    conn, reused = None, False
+                    continue
+                # Whatever went wrong, the slot taken by _checkout() is given back.
+                self._checkin(key, None, False)
+                raise
+            break
+
+        reusable = False
+        try:
+            length = response.getheader("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_response_bytes:
+                raise FetchError("%s response of %s bytes is larger than %d" % (host, length, self.max_response_bytes))
+            body = response.read(self.max_response_bytes + 1)
+            if len(body) > self.max_response_bytes:
+                raise FetchError("%s response is larger than %d bytes" % (host, self.max_response_bytes))
+            reusable = not response.will_close and response.isclosed()
+            return response.status, response.getheader("Location"), body
+        finally:
+            self._checkin(key, conn, reusable)
+
+    def get(self, url, timeout=None):
+        """
+        Downloads url and returns the body as bytes, following redirects. Raises
+        FetchError for error statuses and bodies over max_response_bytes, and
+        socket.timeout if no connection frees up or the server doesn't answer
+        within timeout seconds.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        for i in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                raise FetchError("unsupported url: %s" % url)
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            status, location, body = self._request((parts.scheme, parts.hostname, port), path, timeout, deadline)
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if status != 200:
+                raise FetchError("HTTP %d for %s" % (status, url))
+            return body
+        raise FetchError("too many redirects for %s" % url)
+
+    def clear(self):
+        """
+        Closes every idle connection.
+        """
+        with self._cond:
+            self._closeIdle()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': sum(self._active.values()),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+asset_pool = ConnectionPool()
@@ -0,0 +1,109 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Encodes profile images for output. The formats are:
+
+    png             PNG, compress_level 0-9 (zlib's default if not given).
+    png-palette     PNG quantized to at most colors colors (default 256).
+                    Cards and signatures use few colors so this is much smaller.
+    webp            Lossy WebP at quality 0-100 (default 80).
+    webp-lossless   Lossless WebP.
+
+WebP needs Pillow built with libwebp, see available().
+"""
+import io, time
+from PIL import Image
+
+MIMETYPES = {
+    'png': "image/png",
+    'png-palette': "image/png",
+    'webp': "image/webp",
+    'webp-lossless': "image/webp",
+}
+
+_available = {}
+
+class EncodedImage:
+    def __init__(self, data, format, options, encode_time):
+        """
+        Encoded image data, a bytes object or a memoryview over the encoder's
+        buffer, with the format, encoded size in bytes and seconds spent encoding.
+        """
+        self.data = data
+        self.format = format
+        self.options = options
+        self.mimetype = MIMETYPES[format]
+        self.size = len(data)
+        self.encode_time = encode_time
+
+def encodingKey(format="png", **options):
+    """
+    Returns a string identifying a format and its options, for use in cache keys.
+    """
+    return ";".join([format] + ["%s=%s" % (name, options[name]) for name in sorted(options)])
+
+def _save(image, stream, format, options):
+    if format == 'png':
+        if options.get('compress_level') is not None:
+            image.save(stream, "PNG", compress_level=options['compress_level'])
+        else:
+            image.save(stream, "PNG")
+    elif format == 'png-palette':
+        quantized = image.convert("RGB").convert("P", palette=Image.ADAPTIVE, colors=options.get('colors', 256))
+        if options.get('compress_level') is not None:
+            quantized.save(stream, "PNG", compress_level=options['compress_level'])
+        else:
+            quantized.save(stream, "PNG")
+    elif format == 'webp':
+        image.save(stream, "WEBP", quality=options.get('quality', 80))
+    elif format == 'webp-lossless':
+        image.save(stream, "WEBP", lossless=True)
+    else:
+        raise ValueError("Unknown image format: %s" % format)
+
+def available(format):
+    """
+    Returns True if this Pillow build can encode format.
+    """
+    if format not in _available:
+        try:
+            _save(Image.new("RGB", (1, 1)), io.BytesIO(), format, {})
+            _available[format] = True
+        except Exception:
+            _available[format] = False
+    return _available[format]
+
+def encode(image, format="png", as_memoryview=False, **options):
+    """
+    Encodes a PIL image and returns an EncodedImage. With as_memoryview the data
+    is a memoryview of the encoder's buffer instead of a copy of it as bytes.
+    Raises ValueError for unknown or unavailable formats.
+    """
+    if format not in MIMETYPES:
+        raise ValueError("Unknown image format: %s" % format)
+    if not available(format):
+        raise ValueError("Image format %s isn't supported by this Pillow build" % format)
+    start = time.time()
+    stream = io.BytesIO()
+    _save(image, stream, format, options)
+    if as_memoryview and hasattr(stream, 'getbuffer'):
+        data = stream.getbuffer()
+    else:
+        data = stream.getvalue()
+    return EncodedImage(data, format, options, time.time() - start)
@@ -0,0 +1,217 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Timing of the stages of drawing a profile image. Every stage reports an Event
+to the sinks added to the shared instrumentation object. The stages are:
+
+    profile         Looking up the user and group profile (through the cache).
+                    Background refreshes of stale profiles have refresh=background.
+    template        Decoding a template image the first time it is used.
+    asset_fetch     Downloading one asset. Abandoned downloads are "timeout".
+    asset_decode    Decoding and resizing one downloaded asset.
+    draw_profile    Drawing a public profile.
+    draw_error      Drawing the error image.
+    encode          Encoding the drawn image, nbytes is the encoded size.
+
+A sink is any callable taking an Event. LoggingSink, StatsdSink and
+PrometheusSink are provided:
+
+    from steamprofilecard.instrument import instrumentation, PrometheusSink
+    metrics = PrometheusSink()
+    instrumentation.add(metrics)
+    ...
+    text = metrics.render()
+
+Without sinks, stage() returns a shared object that does nothing.
+"""
+import logging, socket, threading, time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+log = logging.getLogger(__name__)
+
+class Event:
+    def __init__(self, stage, duration, nbytes=0, outcome="ok", error=None, tags=None):
+        """
+        A finished stage: its name, the duration in seconds, the bytes it
+        produced or consumed, the outcome ("ok", "error" or "timeout"), the
+        exception text for errors and a dict of extra tags such as the imgtype.
+        """
+        self.stage = stage
+        self.duration = duration
+        self.nbytes = nbytes
+        self.outcome = outcome
+        self.error = error
+        self.tags = tags or {}
+
+class _Stage:
+    def __init__(self, instrumentation, name, tags):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.tags = tags
+        self.nbytes = 0
+        self.outcome = "ok"
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        error = None
+        if exc_type is not None:
+            self.outcome = "error"
+            error = "%s: %s" % (exc_type.__name__, exc_value)
+        self.instrumentation.emit(Event(self.name, _clock() - self.start, self.nbytes, self.outcome, error, self.tags))
+        return False
+
+class _NullStage:
+    # Attributes set by the instrumented code are ignored.
+    nbytes = 0
+    outcome = "ok"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class Instrumentation:
+    def __init__(self):
+        self.sinks = []
+        self._lock = threading.Lock()
+
+    def add(self, sink):
+        """
+        Adds a callable that is passed every Event.
+        """
+        with self._lock:
+            self.sinks = self.sinks + [sink]
+
+    def remove(self, sink):
+        with self._lock:
+            self.sinks = [other for other in self.sinks if other is not sink]
+
+    def clear(self):
+        with self._lock:
+            self.sinks = []
+
+    def enabled(self):
+        return bool(self.sinks)
+
+    def stage(self, name, **tags):
+        """
+        Returns a context manager timing the stage name. The instrumented code can
+        set nbytes and outcome on it. An exception leaving the block is reported
+        with the outcome "error" and isn't caught.
+        """
+        if not self.sinks:
+            return _NULL_STAGE
+        return _Stage(self, name, tags)
+
+    def emit(self, event):
+        """
+        Passes event to every sink. A failing sink is logged and never breaks drawing.
+        """
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception:
+                log.exception("Instrumentation sink %r failed", sink)
+
+class LoggingSink:
+    def __init__(self, logger=None, level=logging.DEBUG):
+        """
+        Logs every event at level, and failed ones at WARNING.
+        """
+        self.logger = logger or log
+        self.level = level
+
+    def __call__(self, event):
+        tags = " ".join("%s=%s" % (name, event.tags[name]) for name in sorted(event.tags))
+        if event.outcome == "ok":
+            self.logger.log(self.level, "%s %.2fms %d bytes %s", event.stage, event.duration * 1000.0, event.nbytes, tags)
+        else:
+            self.logger.warning("%s %s after %.2fms %s %s", event.stage, event.outcome, event.duration * 1000.0,
+                                event.error or "", tags)
+
+class StatsdSink:
+    def __init__(self, host="127.0.0.1", port=8125, prefix="steamprofilecard"):
+        """
+        Sends every event over UDP in the StatsD format: a timer for the duration,
+        a counter for the outcome and, if nonzero, a counter for the bytes.
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, event):
+        name = "%s.%s" % (self.prefix, event.stage)
+        lines = ["%s.duration:%.3f|ms" % (name, event.duration * 1000.0), "%s.%s:1|c" % (name, event.outcome)]
+        if event.nbytes:
+            lines.append("%s.bytes:%d|c" % (name, event.nbytes))
+        try:
+            self.sock.sendto("\n".join(lines).encode("ascii"), self.address)
+        except socket.error:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+class PrometheusSink:
+    def __init__(self, prefix="steamprofilecard"):
+        """
+        Aggregates events into counters that render() returns in the Prometheus
+        text exposition format.
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.outcomes = {}
+        self.nbytes = {}
+
+    def __call__(self, event):
+        with self._lock:
+            total, count = self.seconds.get(event.stage, (0.0, 0))
+            self.seconds[event.stage] = (total + event.duration, count + 1)
+            key = (event.stage, event.outcome)
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            self.nbytes[event.stage] = self.nbytes.get(event.stage, 0) + event.nbytes
+
+    def render(self):
+        with self._lock:
+            lines = ["# HELP %s_stage_seconds Time spent in each render stage." % self.prefix,
+                     "# TYPE %s_stage_seconds summary" % self.prefix]
+            for stage in sorted(self.seconds):
+                total, count = self.seconds[stage]
+                lines.append('%s_stage_seconds_sum{stage="%s"} %.6f' % (self.prefix, stage, total))
+                lines.append('%s_stage_seconds_count{stage="%s"} %d' % (self.prefix, stage, count))
+            lines.extend(["# HELP %s_stage_total Finished render stages by outcome." % self.prefix,
+                          "# TYPE %s_stage_total counter" % self.prefix])
+            for stage, outcome in sorted(self.outcomes):
+                lines.append('%s_stage_total{stage="%s",outcome="%s"} %d'
+                             % (self.prefix, stage, outcome, self.outcomes[(stage, outcome)]))
+            lines.extend(["# HELP %s_stage_bytes_total Bytes handled by each render stage." % self.prefix,
+                          "# TYPE %s_stage_bytes_total counter" % self.prefix])
+            for stage in sorted(self.nbytes):
+                lines.append('%s_stage_bytes_total{stage="%s"} %d' % (self.prefix, stage, self.nbytes[stage]))
+        return "\n".join(lines) + "\n"
+
+instrumentation = Instrumentation()
@@ -0,0 +1,386 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Profile images are described as a list of elements, drawn in order on top of the
+template. Every element is a dict with a 'type' and a 'pos', and most have a
+'bind' naming the profile field it shows (see profileFields). The types are:
+
+    text    Draws format % field with 'font' ("large" or "small") in 'fill',
+            white by default. A text element with a literal 'text' instead of
+            'bind' is static.
+    image   Pastes the asset at the url in the field, resized to 'size' if set.
+    status  Pastes the online status dot whose color is picked from 'colors',
+            a list of [states, color] pairs, falling back to 'default'.
+    level   Pastes the Steam level badge for the field.
+    strip   Pastes the asset urls in a list field, one 'step' apart, after
+            applying 'slice' and 'reverse'. Missing icons leave no gap.
+
+'when' and 'unless' list fields that must all be set, or all unset, for the
+element to be drawn. A template can replace the built in layout for its imgtype
+with a <template>.json file holding the element list next to its PNG.
+"""
+import json, os, threading
+from datetime import datetime
+from PIL import ImageDraw
+
+from steamprofilecard import sprites
+from steamprofilecard.resources import resources
+
+CARD_STATUS_COLORS = [
+    (['Online', 'Looking to Trade', 'Looking to Play'], "#00FF00"),
+    (['Away', 'Snooze'], "#FF9933"),
+    (['Busy'], "#FF0000"),
+]
+
+SIG_STATUS_COLORS = [
+    (['Online', 'Snooze'], "#00FF00"),
+]
+
+LAYOUTS = {
+    'card': [
+        {'type': 'text', 'pos': (73, 35), 'font': 'large', 'bind': 'personaname'},
+        {'type': 'text', 'pos': (65, 52), 'font': 'small', 'bind': 'joined', 'format': "Joined: %s"},
+        {'type': 'text', 'pos': (65, 62), 'font': 'small', 'bind': 'steamlevel', 'format': "Steam Level: %s"},
+        {'type': 'text', 'pos': (65, 72), 'font': 'small', 'bind': 'playtime_2weeks', 'format': "Played: %s hrs past 2 weeks"},
+        {'type': 'status', 'pos': (65, 40), 'bind': 'personastate', 'colors': CARD_STATUS_COLORS, 'default': "#A3A3A3"},
+        {'type': 'level', 'pos': (176, 5), 'bind': 'steamlevel'},
+        {'type': 'image', 'pos': (5, 35), 'size': (55, 55), 'bind': 'avatar'},
+        {'type': 'image', 'pos': (5, 5), 'size': (20, 20), 'bind': 'group_icon', 'when': ['group']},
+        {'type': 'text', 'pos': (5, 90), 'font': 'small', 'bind': 'groupname', 'format': '"%s" Member', 'when': ['group']},
+        {'type': 'text', 'pos': (30, 7), 'font': 'large', 'bind': 'profileurlname', 'when': ['group', 'profileurlname']},
+        {'type': 'text', 'pos': (5, 7), 'font': 'large', 'bind': 'profileurlname', 'when': ['profileurlname'], 'unless': ['group']},
+        {'type': 'image', 'pos': (5, 112), 'bind': 'game_icon', 'when': ['games']},
+        {'type': 'text', 'pos': (40, 112), 'font': 'small', 'bind': 'game_name', 'when': ['games']},
+        {'type': 'text', 'pos': (40, 122), 'font': 'small', 'bind': 'game_hours', 'format': "%s hours", 'when': ['games']},
+        {'type': 'strip', 'pos': (138, 112), 'step': (35, 0), 'bind': 'game_icons', 'slice': (1, 3), 'when': ['games']},
+    ],
+    'sig': [
+        {'type': 'image', 'pos': (5, 5), 'size': (40, 40), 'bind': 'avatar'},
+        {'type': 'image', 'pos': (57, 2), 'size': (20, 20), 'bind': 'group_icon', 'when': ['group']},
+        {'type': 'status', 'pos': (82, 9), 'bind': 'personastate', 'colors': SIG_STATUS_COLORS, 'default': "#FF0000", 'when': ['group']},
+        {'type': 'text', 'pos': (90, 4), 'font': 'large', 'bind': 'personaname', 'when': ['group']},
+        {'type': 'status', 'pos': (57, 9), 'bind': 'personastate', 'colors': SIG_STATUS_COLORS, 'default': "#FF0000", 'unless': ['group']},
+        {'type': 'text', 'pos': (65, 4), 'font': 'large', 'bind': 'personaname', 'unless': ['group']},
+        {'type': 'text', 'pos': (57, 35), 'font': 'small', 'bind': 'steamlevel', 'format': "Steam Level: %s"},
+        {'type': 'text', 'pos': (57, 25), 'font': 'small', 'bind': 'playtime_2weeks', 'format': "Played: %s hrs past 2 weeks"},
+        # This doesn't look very good, and the entire sig needs to have a
+        # new layout.
+        # {'type': 'level', 'pos': (175, 7), 'bind': 'steamlevel'},
+        {'type': 'strip', 'pos': (325, 25), 'step': (-25, 0), 'size': (20, 20), 'bind': 'game_icons', 'slice': (0, 5), 'reverse': True},
+    ],
+}
+
+def profileFields(user_profile, primary_group_profile):
+    """
+    Returns the dict of values layout elements can bind to for a user profile and
+    its primary group profile, which may be None.
+    """
+    games = user_profile.recentlyplayedgames or []
+    minutes = 0
+    for game in games:
+        minutes += game['playtime_2weeks']
+    fields = {
+        'personaname': user_profile.personaname,
+        'personastate': user_profile.personastate,
+        'profileurlname': user_profile.profileurlname,
+        'joined': datetime.utcfromtimestamp(int(user_profile.timecreated)).strftime('%B %d, %Y'),
+        'steamlevel': user_profile.steamlevel,
+        'playtime_2weeks': (minutes + 60 // 2) // 60,
+        'avatar': user_profile.avatarmedium,
+        'group': primary_group_profile is not None,
+        'groupname': None,
+        'group_icon': None,
+        'games': len(games) > 0,
+        'game_icons': [game.get('img_icon_url') for game in games],
+        'game_name': None,
+        'game_hours': None,
+        'game_icon': None,
+    }
+    if primary_group_profile:
+        fields['groupname'] = primary_group_profile.groupname
+        fields['group_icon'] = primary_group_profile.avataricon
+    if games:
+        name = games[0]['name']
+        fields['game_name'] = (name[:23] + "...") if len(name) > 25 else name
+        fields['game_hours'] = (games[0]['playtime_2weeks'] + 60 // 2) // 60
+        fields['game_icon'] = games[0].get('img_icon_url')
+    return fields
+
+def _compileElement(element):
+    """
+    Returns a copy of a layout element with defaults filled in, positions as
+    tuples and the font resolved.
+    """
+    element = dict(element)
+    for key in ('pos', 'size', 'step', 'slice'):
+        if element.get(key) is not None:
+            element[key] = tuple(element[key])
+    element.setdefault('size', None)
+    element.setdefault('format', "%s")
+    element.setdefault('when', [])
+    element.setdefault('unless', [])
+    if element['type'] == 'text':
+        element['font'] = resources.font(element.get('font', 'small'))
+        element.setdefault('fill', "#FFFFFF")
+    return element
+
+def _isStatic(element):
+    return element['type'] == 'text' and 'bind' not in element and not element['when'] and not element['unless']
+
+class Layout:
+    def __init__(self, imgtype, template, size, elements):
+        """
+        A layout ready to be drawn. The template and every static element are
+        composited into self.base once, so a render only copies the base and
+        draws the elements bound to profile fields.
+        """
+        self.imgtype = imgtype
+        self.template = template
+        self.size = size
+        elements = [_compileElement(element) for element in elements]
+        self.elements = [element for element in elements if not _isStatic(element)]
+        self.base = resources.template(imgtype, template, size)
+        draw = ImageDraw.Draw(self.base)
+        for element in elements:
+            if _isStatic(element):
+                draw.text(element['pos'], element['text'], fill=element['fill'], font=element['font'])
+
+    def visible(self, fields):
+        """
+        Returns the elements whose 'when' and 'unless' conditions hold for fields.
+        """
+        return [element for element in self.elements
+                if all(fields.get(name) for name in element['when'])
+                and not any(fields.get(name) for name in element['unless'])]
+
+    def __stripUrls(self, element, fields):
+        urls = fields.get(element['bind']) or []
+        if element.get('slice'):
+            urls = urls[element['slice'][0]:element['slice'][1]]
+        if element.get('reverse'):
+            urls = list(reversed(urls))
+        return urls
+
+    def assetRequests(self, fields):
+        """
+        Returns (url, size) pairs for every asset the layout pastes for fields.
+        """
+        requests = []
+        for element in self.visible(fields):
+            if element['type'] == 'image':
+                requests.append((fields.get(element['bind']), element['size']))
+            elif element['type'] == 'strip':
+                for url in self.__stripUrls(element, fields):
+                    requests.append((url, element['size']))
+        return requests
+
+    def __statusColor(self, element, value):
+        for states, color in element.get('colors', []):
+            if value in states:
+                return color
+        return element.get('default')
+
+    def __stripAssets(self, element, fields, assets):
+        """
+        Returns the (url, image) pairs a strip pastes, skipping icons that are missing.
+        """
+        pasted = []
+        for url in self.__stripUrls(element, fields):
+            asset = assets.get((url, element['size']))
+            if asset:
+                pasted.append((url, asset))
+        return pasted
+
+    def state(self, element, fields, assets):
+        """
+        Returns a value that only changes when the pixels drawn by element change.
+        """
+        kind = element['type']
+        value = fields.get(element.get('bind'))
+        if kind == 'text':
+            return element['format'] % (value,)
+        elif kind == 'image':
+            return (value, (value, element['size']) in assets)
+        elif kind == 'status':
+            return self.__statusColor(element, value)
+        elif kind == 'level':
+            return str(value)
+        elif kind == 'strip':
+            return tuple(url for url, asset in self.__stripAssets(element, fields, assets))
+
+    def bbox(self, element, fields, assets):
+        """
+        Returns the (left, upper, right, lower) box element draws into, clipped to
+        the image, or None if it draws nothing.
+        """
+        kind = element['type']
+        value = fields.get(element.get('bind'))
+        x, y = element['pos']
+        box = None
+        if kind == 'text':
+            text = element['format'] % (value,)
+            if hasattr(element['font'], 'getbbox'):
+                left, upper, right, lower = element['font'].getbbox(text)
+            else:
+                left, upper = 0, 0
+                right, lower = element['font'].getsize(text)
+            # Antialiasing can touch a pixel past the reported box.
+            box = (x + left - 1, y + upper - 1, x + right + 1, y + lower + 1)
+        elif kind == 'image':
+            asset = assets.get((value, element['size']))
+            if asset:
+                box = (x, y, x + asset.size[0], y + asset.size[1])
+        elif kind == 'status':
+            dot = sprites.onlineState(self.__statusColor(element, value))
+            box = (x, y, x + dot.size[0], y + dot.size[1])
+        elif kind == 'level':
+            badge = sprites.steamLevel(str(value))
+            box = (x, y, x + badge.size[0], y + badge.size[1])
+        elif kind == 'strip':
+            boxes = []
+            for url, asset in self.__stripAssets(element, fields, assets):
+                boxes.append((x, y, x + asset.size[0], y + asset.size[1]))
+                x, y = x + element['step'][0], y + element['step'][1]
+            if boxes:
+                box = (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                       max(b[2] for b in boxes), max(b[3] for b in boxes))
+        if box is None:
+            return None
+        box = (max(box[0], 0), max(box[1], 0), min(box[2], self.size[0]), min(box[3], self.size[1]))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return None
+        return box
+
+    def drawElement(self, image, draw, element, fields, assets):
+        """
+        Draws a single element onto image.
+        """
+        kind = element['type']
+        value = fields.get(element.get('bind'))
+        if kind == 'text':
+            sprites.drawText(image, element['pos'], element['format'] % (value,), element['font'], element['fill'])
+        elif kind == 'image':
+            asset = assets.get((value, element['size']))
+            if asset:
+                image.paste(asset, element['pos'])
+        elif kind == 'status':
+            dot = sprites.onlineState(self.__statusColor(element, value))
+            image.paste(dot, element['pos'], dot)
+        elif kind == 'level':
+            badge = sprites.steamLevel(str(value))
+            image.paste(badge, element['pos'], badge)
+        elif kind == 'strip':
+            x, y = element['pos']
+            for url, asset in self.__stripAssets(element, fields, assets):
+                image.paste(asset, (x, y))
+                x, y = x + element['step'][0], y + element['step'][1]
+
+    def render(self, fields, assets):
+        """
+        Returns a new PIL image with every visible element drawn for fields. assets
+        is a dict of (url, size) to PIL image, as returned for assetRequests().
+        """
+        image = self.base.copy()
+        draw = ImageDraw.Draw(image)
+        for element in self.visible(fields):
+            self.drawElement(image, draw, element, fields, assets)
+        return image
+
+    def renderIncremental(self, fields, assets, previous=None):
+        """
+        Returns a Composition for fields, reusing previous, an earlier Composition
+        of this layout, where possible. Only the elements whose state changed are
+        repainted, after restoring their old and new boxes from the base image.
+        Any other element overlapping a restored box is repainted too, so the
+        result is identical to a full render.
+        """
+        visible = self.visible(fields)
+        states = [self.state(element, fields, assets) for element in visible]
+        boxes = [self.bbox(element, fields, assets) for element in visible]
+        if previous is None or previous.layout is not self or [id(e) for e in visible] != previous.element_ids:
+            return Composition(self, self.render(fields, assets), visible, states, boxes)
+
+        redraw = set(i for i in range(len(visible)) if states[i] != previous.states[i])
+        if not redraw:
+            return previous
+        dirty = []
+        for i in redraw:
+            dirty.extend(box for box in (previous.boxes[i], boxes[i]) if box)
+        grown = True
+        while grown:
+            grown = False
+            for i in range(len(visible)):
+                if i not in redraw and boxes[i] and any(_overlaps(boxes[i], box) for box in dirty):
+                    redraw.add(i)
+                    dirty.append(boxes[i])
+                    grown = True
+
+        image = previous.image.copy()
+        for box in dirty:
+            image.paste(self.base.crop(box), box[:2])
+        draw = ImageDraw.Draw(image)
+        for i in sorted(redraw):
+            self.drawElement(image, draw, visible[i], fields, assets)
+        return Composition(self, image, visible, states, boxes)
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+class Composition:
+    def __init__(self, layout, image, elements, states, boxes):
+        """
+        A rendered image together with the state and box of every element drawn
+        on it, so the next render of the same profile can be incremental.
+        """
+        self.layout = layout
+        self.image = image
+        self.element_ids = [id(element) for element in elements]
+        self.states = states
+        self.boxes = boxes
+
+def loadElements(imgtype, template):
+    """
+    Returns the element list from the template's .json file if there is one,
+    otherwise the built in layout for imgtype.
+    """
+    layoutfile = os.path.join(resources.template_path, imgtype, template + ".json")
+    if os.path.isfile(layoutfile):
+        with open(layoutfile) as f:
+            return json.load(f)
+    return LAYOUTS[imgtype]
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+def compileLayout(imgtype, template, size):
+    """
+    Returns the Layout for imgtype and template, compiling it on first use.
+    """
+    key = (imgtype, template, size)
+    layout = _layouts.get(key)
+    if layout is None:
+        with _layouts_lock:
+            layout = _layouts.get(key)
+            if layout is None:
+                layout = _layouts[key] = Layout(imgtype, template, size, loadElements(imgtype, template))
+    return layout
+
+def clearLayouts():
+    with _layouts_lock:
+        _layouts.clear()
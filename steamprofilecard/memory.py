@@ -0,0 +1,189 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Keeps a long running worker within a memory ceiling by sizing the shared caches
+from one budget and bounding how many images are drawn at once:
+
+    from steamprofilecard import memory
+    memory.install(memory.MemoryGovernor(256 * 1024 * 1024))
+
+Without a governor installed the caches keep their own sizes and renders
+aren't limited.
+"""
+import sys, threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from steamprofilecard.cache import image_cache, profile_cache, render_cache, composition_cache, \
+    sprite_cache, text_cache
+
+# Share of the budget given to each cache and to the images being drawn.
+SHARES = {
+    'image_cache': 0.40,
+    'render_cache': 0.20,
+    'composition_cache': 0.15,
+    'profile_cache': 0.08,
+    'text_cache': 0.05,
+    'sprite_cache': 0.02,
+    'renders': 0.10,
+}
+
+# Rough size of a cached ProfileRecord with its games and group.
+PROFILE_BYTES = 2 * 1024
+
+# Rough peak memory of drawing and encoding one card: the template copy, the
+# kept composition, the returned copy and the encoder's buffers.
+RENDER_BYTES = 512 * 1024
+
+def _caches():
+    return ((image_cache, 'image_cache'), (render_cache, 'render_cache'), (composition_cache, 'composition_cache'),
+            (text_cache, 'text_cache'), (sprite_cache, 'sprite_cache'))
+
+class _NullSlot:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SLOT = _NullSlot()
+
+class _RenderSlot:
+    def __init__(self, governor):
+        self.governor = governor
+
+    def __enter__(self):
+        self.governor._slots.acquire()
+        with self.governor._lock:
+            self.governor.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self.governor._lock:
+            self.governor.in_flight -= 1
+        self.governor._slots.release()
+        return False
+
+class MemoryGovernor:
+    def __init__(self, limit, shares=None):
+        """
+        Splits limit bytes between the shared caches and in-flight renders by
+        shares, see SHARES. Renders past the number that fit in their share wait
+        for one to finish.
+        """
+        self.limit = limit
+        self.shares = dict(SHARES, **(shares or {}))
+        self.max_renders = max(1, int(limit * self.shares['renders']) // RENDER_BYTES)
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.max_renders)
+        self._lock = threading.Lock()
+
+    def budgets(self):
+        """
+        Returns the byte budget of every cache. The profile cache counts profiles,
+        so its budget is converted with PROFILE_BYTES.
+        """
+        budgets = {}
+        for cache, name in _caches():
+            budgets[name] = int(self.limit * self.shares[name])
+        budgets['profile_cache'] = max(1, int(self.limit * self.shares['profile_cache']) // PROFILE_BYTES)
+        return budgets
+
+    def apply(self):
+        """
+        Resizes the shared caches to their budgets, evicting entries that no longer fit.
+        """
+        resizeCaches(self.budgets())
+
+    def renderSlot(self):
+        """
+        Returns a context manager held while an image is drawn and encoded.
+        """
+        return _RenderSlot(self)
+
+    def stats(self):
+        stats = {
+            'limit': self.limit,
+            'max_renders': self.max_renders,
+            'in_flight': self.in_flight,
+            'profiles': profile_cache.stats()['entries'],
+            'peak_rss': peakRss(),
+        }
+        for cache, name in _caches():
+            stats[name] = cache.size
+        return stats
+
+def cacheSizes():
+    """
+    Returns the current size of every shared cache, in the form of
+    MemoryGovernor.budgets(), so it can be given back to resizeCaches().
+    """
+    sizes = {}
+    for cache, name in _caches():
+        sizes[name] = cache.max_bytes
+    sizes['profile_cache'] = profile_cache.max_profiles
+    return sizes
+
+def resizeCaches(sizes):
+    """
+    Resizes the shared caches to sizes, a dict like MemoryGovernor.budgets().
+    """
+    for cache, name in _caches():
+        cache.resize(sizes[name])
+    profile_cache.resize(sizes['profile_cache'])
+
+def peakRss():
+    """
+    Returns the peak resident set size of this process in bytes, or None where
+    the resource module isn't available.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes.
+    return usage if sys.platform == "darwin" else usage * 1024
+
+governor = None
+
+def install(new):
+    """
+    Makes new the governor used by every SteamProfileCard and applies its budgets.
+    """
+    global governor
+    new.apply()
+    governor = new
+
+def uninstall():
+    """
+    Stops limiting renders. The caches keep the sizes the governor gave them.
+    """
+    global governor
+    governor = None
+
+def renderSlot():
+    """
+    Returns the installed governor's render slot, or a context manager that does
+    nothing if there is none.
+    """
+    if governor is None:
+        return _NULL_SLOT
+    return governor.renderSlot()
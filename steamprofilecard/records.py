@@ -0,0 +1,85 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Compact copies of steamwebapi profiles holding only what the drawing code reads.
+They are what the profile cache keeps, so a cached profile costs a few hundred
+bytes instead of a full User object with every field the Steam API returns.
+
+The classes derive from object since __slots__ needs new style classes on
+Python 2.
+"""
+
+class GameRecord(object):
+    __slots__ = ('name', 'playtime_2weeks', 'img_icon_url')
+
+    def __init__(self, name, playtime_2weeks, img_icon_url):
+        self.name = name
+        self.playtime_2weeks = playtime_2weeks
+        self.img_icon_url = img_icon_url
+
+    @classmethod
+    def fromGame(cls, game):
+        return cls(game.get('name'), game.get('playtime_2weeks'), game.get('img_icon_url'))
+
+    # Games are read like the dicts in User.recentlyplayedgames.
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+class ProfileRecord(object):
+    __slots__ = ('communityvisibilitystate', 'personaname', 'personastate', 'profileurlname',
+                 'timecreated', 'steamlevel', 'avatarmedium', 'recentlyplayedgames')
+
+    def __init__(self, communityvisibilitystate, personaname, personastate, profileurlname,
+                 timecreated, steamlevel, avatarmedium, recentlyplayedgames=()):
+        self.communityvisibilitystate = communityvisibilitystate
+        self.personaname = personaname
+        self.personastate = personastate
+        self.profileurlname = profileurlname
+        self.timecreated = timecreated
+        self.steamlevel = steamlevel
+        self.avatarmedium = avatarmedium
+        self.recentlyplayedgames = tuple(recentlyplayedgames)
+
+    @classmethod
+    def fromUser(cls, user):
+        """
+        Returns a ProfileRecord for a steamwebapi User. The visibility and persona
+        states are kept as the names the User properties return.
+        """
+        games = [GameRecord.fromGame(game) for game in user.recentlyplayedgames or []]
+        return cls(user.communityvisibilitystate, user.personaname, user.personastate, user.profileurlname,
+                   user.timecreated, user.steamlevel, user.avatarmedium, games)
+
+class GroupRecord(object):
+    __slots__ = ('groupname', 'avataricon')
+
+    def __init__(self, groupname, avataricon):
+        self.groupname = groupname
+        self.avataricon = avataricon
+
+    @classmethod
+    def fromGroup(cls, group):
+        return cls(group.groupname, group.avataricon)
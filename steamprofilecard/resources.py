@@ -0,0 +1,104 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+import os, threading
+from PIL import Image, ImageFont
+
+from steamprofilecard.instrument import instrumentation
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# Font name to (file, size) for every font the drawing code uses.
+FONTS = {
+    'large': ("FreeSansBold.ttf", 12),
+    'small': ("FreeSansBold.ttf", 8),
+    'level': ("slkscr.ttf", 15),
+}
+
+class ResourceRegistry:
+    def __init__(self, font_path=FONT_PATH, template_path=TEMPLATE_PATH):
+        """
+        Loads fonts and template images the first time they are needed and keeps
+        them in memory, so nothing is read from disk at import time or per render.
+        """
+        self.font_path = font_path
+        self.template_path = template_path
+        self._fonts = {}
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def font(self, name):
+        """
+        Returns the PIL font registered in FONTS under name.
+        """
+        font = self._fonts.get(name)
+        if font is None:
+            filename, size = FONTS[name]
+            with self._lock:
+                font = self._fonts.get(name)
+                if font is None:
+                    font = ImageFont.truetype(os.path.join(self.font_path, filename), size, encoding="unic")
+                    self._fonts[name] = font
+        return font
+
+    def __decodeTemplate(self, imgtype, template, size):
+        """
+        Reads a template PNG from disk and converts it to RGB. Returns None if the
+        file can't be read or isn't exactly size, which is reported to the
+        instrumentation as a failed "template" stage.
+        """
+        templatefile = os.path.join(self.template_path, imgtype, template + ".png")
+        if not os.path.isfile(templatefile):
+            return None
+        try:
+            with instrumentation.stage("template", imgtype=imgtype, template=template) as stage:
+                with open(templatefile, 'rb') as f:
+                    image = Image.open(f).convert("RGB")
+                if image.size != size:
+                    raise ValueError("template is %dx%d, not %dx%d" % (image.size + size))
+                stage.nbytes = size[0] * size[1] * 3
+        except Exception:
+            return None
+        return image
+
+    def template(self, imgtype, template, size):
+        """
+        Returns a copy of the decoded template image for imgtype, ready to be drawn
+        on. If the template can't be found or doesn't match size a blank gray image
+        is returned instead. Missing templates aren't remembered, so adding one
+        doesn't need a restart.
+        """
+        key = (imgtype, template, size)
+        image = self._templates.get(key)
+        if image is None:
+            image = self.__decodeTemplate(imgtype, template, size)
+            if image is None:
+                return Image.new("RGB", size, color="#808080")
+            with self._lock:
+                self._templates[key] = image
+        return image.copy()
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self._templates.clear()
+
+# Process wide registry shared by every SteamProfileCard.
+resources = ResourceRegistry()
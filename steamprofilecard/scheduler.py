@@ -0,0 +1,202 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Keeps the images of a known set of profiles rendered ahead of time, so a web
+request for them is a lookup in a RenderStore instead of a fetch and a render.
+"""
+import heapq, random, threading, time
+
+from steamprofilecard.assets import ASSET_TIMEOUT
+from steamprofilecard.cache import RenderStore, profile_cache
+from steamprofilecard.steamprofilecard import SteamProfileCard
+
+# Seconds between refreshes by personastate. Private profiles and profiles that
+# couldn't be looked up use the "Private" and "error" entries.
+INTERVALS = {
+    'Online': 60,
+    'Looking to Play': 60,
+    'Looking to Trade': 60,
+    'Busy': 120,
+    'Away': 300,
+    'Snooze': 900,
+    'Offline': 1800,
+    'Private': 3600,
+    'error': 300,
+}
+
+class RefreshScheduler:
+    def __init__(self, store=None, imgtypes=("card", "sig"), template="default", encodings=None,
+                 intervals=None, jitter=0.1, asset_timeout=ASSET_TIMEOUT, source=None):
+        """
+        Renders imgtypes of every watched profile into store, a RenderStore, and
+        renders them again after the interval for the profile's state, see
+        INTERVALS. Each interval is spread by up to jitter of its length so
+        profiles watched together don't all refresh at once. encodings maps an
+        imgtype to (format, options) as in ProfileCardApp. source is the
+        DataSource profiles are looked up in, see steamprofilecard.sources.
+        """
+        self.store = store if store is not None else RenderStore()
+        self.imgtypes = imgtypes
+        self.template = template
+        self.encodings = encodings or {}
+        self.intervals = dict(INTERVALS, **(intervals or {}))
+        self.jitter = jitter
+        self.asset_timeout = asset_timeout
+        self.source = source
+        self._lock = threading.Lock()
+        # steamuserid to its next refresh time. The heap holds (due, steamuserid)
+        # and entries that no longer match _due are skipped.
+        self._due = {}
+        self._heap = []
+        self._running = set()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def watch(self, steamuserid, due=None):
+        """
+        Adds steamuserid to the watch list, refreshed at due or straight away.
+        """
+        self._schedule(steamuserid, time.time() if due is None else due)
+
+    def unwatch(self, steamuserid):
+        """
+        Removes steamuserid from the watch list and its images from the store.
+        """
+        with self._lock:
+            self._due.pop(steamuserid, None)
+        for imgtype in self.imgtypes:
+            self.store.delete((imgtype, steamuserid))
+
+    def watching(self):
+        with self._lock:
+            return sorted(self._due)
+
+    def _schedule(self, steamuserid, due):
+        with self._lock:
+            self._due[steamuserid] = due
+            heapq.heappush(self._heap, (due, steamuserid))
+
+    def _popDue(self, now):
+        """
+        Returns the next steamuserid due at now and not being refreshed, or None.
+        """
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, steamuserid = heapq.heappop(self._heap)
+                if self._due.get(steamuserid) == due and steamuserid not in self._running:
+                    self._running.add(steamuserid)
+                    return steamuserid
+            return None
+
+    def encoding(self, imgtype):
+        return self.encodings.get(imgtype, ("png", {}))
+
+    def interval(self, profile):
+        """
+        Returns the seconds until a profile drawn as profile should be refreshed.
+        """
+        if profile.profileGrabStatus == False:
+            interval = self.intervals['error']
+        elif profile.user_profile.communityvisibilitystate == "Private":
+            interval = self.intervals['Private']
+        else:
+            interval = self.intervals.get(profile.user_profile.personastate, self.intervals['Offline'])
+        if not profile.assetsComplete:
+            interval = min(interval, self.intervals['error'])
+        return interval * (1 + random.uniform(0, self.jitter))
+
+    def refresh(self, steamuserid):
+        """
+        Looks up steamuserid again and renders every imgtype into the store.
+        If the lookup fails the images already in the store are kept. Returns
+        the interval until the next refresh.
+        """
+        profile_cache.invalidate(steamuserid)
+        interval = self.intervals['error']
+        for imgtype in self.imgtypes:
+            profile = SteamProfileCard(steamuserid, imgtype, self.template, self.asset_timeout, self.source)
+            if profile.profileGrabStatus == False:
+                break
+            format, options = self.encoding(imgtype)
+            data = profile.renderToWeb(format, **options)
+            interval = self.interval(profile)
+            if data:
+                # etag() is None if assets were missing, so the image isn't cached downstream.
+                self.store.setRender(imgtype, steamuserid, profile.etag(format, **options), data, format,
+                                     time.time() + interval)
+        return interval
+
+    def run_pending(self, now=None):
+        """
+        Refreshes every watched profile that is due at now, default the current
+        time. Returns how many were refreshed.
+        """
+        if now is None:
+            now = time.time()
+        # Rescheduled profiles are only queued at the end, so a profile due again
+        # before now isn't refreshed twice in one call.
+        rescheduled = []
+        try:
+            while True:
+                steamuserid = self._popDue(now)
+                if steamuserid is None:
+                    return len(rescheduled)
+                try:
+                    interval = self.refresh(steamuserid)
+                except Exception:
+                    interval = self.intervals['error']
+                finally:
+                    with self._lock:
+                        self._running.discard(steamuserid)
+                rescheduled.append((steamuserid, time.time() + interval))
+        finally:
+            for steamuserid, due in rescheduled:
+                with self._lock:
+                    watched = steamuserid in self._due
+                if watched:
+                    self._schedule(steamuserid, due)
+                else:
+                    # Unwatched while it was being refreshed.
+                    for imgtype in self.imgtypes:
+                        self.store.delete((imgtype, steamuserid))
+
+    def _loop(self, poll):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(poll)
+
+    def start(self, workers=2, poll=1.0):
+        """
+        Starts workers background threads running run_pending() every poll seconds.
+        """
+        self._stop.clear()
+        for i in range(workers):
+            thread = threading.Thread(target=self._loop, args=(poll,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Stops the background threads once their current refresh is done.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,253 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+A WSGI application serving /card/<steamuserid>.png and /sig/<steamuserid>.png,
+and optionally the render stage metrics at /metrics.
+"""
+import sys
+
+PYMAJORVER = sys.version_info[0]
+if PYMAJORVER == 3:
+    from socketserver import ThreadingMixIn
+else:
+    from SocketServer import ThreadingMixIn
+
+import multiprocessing, optparse, re, threading, time
+from wsgiref.simple_server import make_server, WSGIServer
+
+from steamprofilecard import encoders, memory
+from steamprofilecard.batch import readIds
+from steamprofilecard.cache import LRUCache, profile_cache
+from steamprofilecard.instrument import instrumentation, PrometheusSink, StatsdSink
+from steamprofilecard.scheduler import RefreshScheduler
+from steamprofilecard.sources import ReplaySource, steam_source
+from steamprofilecard.steamprofilecard import SteamProfileCard, etagMatches
+
+ROUTE = re.compile(r"^/(card|sig)/([A-Za-z0-9_.-]+)\.png$")
+
+def _acquire(semaphore, timeout):
+    """
+    Acquires semaphore, waiting at most timeout seconds. Returns True on success.
+    """
+    if PYMAJORVER == 3:
+        return semaphore.acquire(True, timeout)
+    # Python 2 semaphores can't wait with a timeout.
+    deadline = time.time() + timeout
+    while not semaphore.acquire(False):
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+class ProfileCardApp:
+    def __init__(self, template="default", render_workers=None, fetch_workers=16, queue_timeout=0.5, encodings=None, metrics=None, store=None,
+                 source=None):
+        """
+        render_workers bounds how many images are drawn and encoded at once (default
+        is one per core). fetch_workers separately bounds requests waiting on the
+        Steam API or CDN. A request that can't get a slot within queue_timeout
+        seconds is answered straight away with the last image served for that
+        profile, or with a 503 if there is none. encodings maps an imgtype to the
+        (format, options) it is served in, see steamprofilecard.encoders. PNG is
+        used for imgtypes not in it. If metrics is a PrometheusSink its render()
+        output is served at /metrics. Images found in store, the RenderStore of a
+        RefreshScheduler, are served from it without looking up the profile.
+        source is the DataSource profiles and assets come from, see
+        steamprofilecard.sources.
+        """
+        self.template = template
+        self.encodings = encodings or {}
+        self.queue_timeout = queue_timeout
+        self.metrics = metrics
+        self.store = store
+        self.source = source
+        self.render_slots = threading.BoundedSemaphore(render_workers or multiprocessing.cpu_count())
+        self.fetch_slots = threading.BoundedSemaphore(fetch_workers)
+        # The last (etag, data) served per (imgtype, steamuserid), for overload.
+        self.last_served = LRUCache(16 * 1024 * 1024)
+
+    def __call__(self, environ, start_response):
+        if self.metrics is not None and environ.get('PATH_INFO') == "/metrics":
+            return self.respond(start_response, "200 OK", [], self.metrics.render().encode("utf-8"),
+                                "text/plain; version=0.0.4")
+        match = ROUTE.match(environ.get('PATH_INFO', ''))
+        if not match:
+            return self.respond(start_response, "404 Not Found", [], b"Not Found")
+        if environ.get('REQUEST_METHOD', 'GET') not in ('GET', 'HEAD'):
+            return self.respond(start_response, "405 Method Not Allowed", [('Allow', 'GET, HEAD')], b"Method Not Allowed")
+        imgtype, steamuserid = match.groups()
+        body = self.serve(start_response, imgtype, steamuserid, environ.get('HTTP_IF_NONE_MATCH'))
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return [b""]
+        return body
+
+    def respond(self, start_response, status, headers, body, content_type="text/plain"):
+        headers = headers + [('Content-Type', content_type), ('Content-Length', str(len(body)))]
+        start_response(status, headers)
+        return [body]
+
+    def cacheHeaders(self, profile):
+        """
+        Returns Cache-Control and ETag headers. The max-age is however long the
+        profile stays fresh in the profile cache. Error images and images missing
+        assets are not cached.
+        """
+        format, options = self.encoding(profile.imgtype)
+        etag = profile.etag(format, **options)
+        if profile.profileGrabStatus == False or etag is None:
+            return [('Cache-Control', 'no-cache')]
+        age = profile_cache.age(profile.steamuserid) or 0
+        max_age = max(0, int(profile_cache.fresh - age))
+        return [('Cache-Control', 'public, max-age=%d' % max_age), ('ETag', etag)]
+
+    def encoding(self, imgtype):
+        return self.encodings.get(imgtype, ("png", {}))
+
+    def overloaded(self, start_response, imgtype, steamuserid):
+        """
+        Answers a request that couldn't get a worker slot in time.
+        """
+        last = self.last_served.get((imgtype, steamuserid))
+        if last is None:
+            return self.respond(start_response, "503 Service Unavailable", [('Retry-After', '1')], b"Service Unavailable")
+        etag, data = last
+        format, options = self.encoding(imgtype)
+        headers = [('Cache-Control', 'max-age=0, must-revalidate'), ('Warning', '110 - "Response is Stale"')]
+        if etag is not None:
+            headers.append(('ETag', etag))
+        return self.respond(start_response, "200 OK", headers, data, encoders.MIMETYPES[format])
+
+    def serveStored(self, start_response, stored, if_none_match):
+        """
+        Answers a request from an image pre-rendered by a RefreshScheduler. It
+        can be cached until the scheduler renders it again, unless it was drawn
+        with assets missing.
+        """
+        etag, data, format, expires = stored
+        if etag is None:
+            return self.respond(start_response, "200 OK", [('Cache-Control', 'no-cache')], data, encoders.MIMETYPES[format])
+        max_age = max(0, int(expires - time.time()))
+        headers = [('Cache-Control', 'public, max-age=%d' % max_age), ('ETag', etag)]
+        if if_none_match and etagMatches(if_none_match, etag):
+            start_response("304 Not Modified", headers)
+            return [b""]
+        return self.respond(start_response, "200 OK", headers, data, encoders.MIMETYPES[format])
+
+    def serve(self, start_response, imgtype, steamuserid, if_none_match):
+        if self.store is not None:
+            stored = self.store.getRender(imgtype, steamuserid)
+            if stored is not None and stored[2] == self.encoding(imgtype)[0]:
+                return self.serveStored(start_response, stored, if_none_match)
+
+        # Profiles the cache can answer without a lookup don't need an upstream
+        # fetch slot. Expired entries are looked up again and do, as does every
+        # profile of a source that bypasses the cache.
+        needs_fetch = (self.source or steam_source).bypass_cache or not profile_cache.usable(steamuserid)
+        if needs_fetch and not _acquire(self.fetch_slots, self.queue_timeout):
+            return self.overloaded(start_response, imgtype, steamuserid)
+        try:
+            profile = SteamProfileCard(steamuserid, imgtype, self.template, source=self.source)
+        finally:
+            if needs_fetch:
+                self.fetch_slots.release()
+
+        format, options = self.encoding(imgtype)
+        if profile.profileGrabStatus and profile.notModified(if_none_match, format, **options):
+            start_response("304 Not Modified", self.cacheHeaders(profile))
+            return [b""]
+
+        data = profile.cachedRender(format, **options)
+        if data is None:
+            if profile.profileGrabStatus:
+                if not _acquire(self.fetch_slots, self.queue_timeout):
+                    return self.overloaded(start_response, imgtype, steamuserid)
+                try:
+                    profile.prefetchAssets()
+                finally:
+                    self.fetch_slots.release()
+            if not _acquire(self.render_slots, self.queue_timeout):
+                return self.overloaded(start_response, imgtype, steamuserid)
+            try:
+                data = profile.renderToWeb(format, **options)
+            finally:
+                self.render_slots.release()
+            if not data:
+                return self.respond(start_response, "500 Internal Server Error", [], b"Internal Server Error")
+
+        # The headers depend on whether the draw was missing assets.
+        headers = self.cacheHeaders(profile)
+        if profile.profileGrabStatus:
+            self.last_served.set((imgtype, steamuserid), (profile.etag(format, **options), data), len(data))
+        return self.respond(start_response, "200 OK", headers, data, encoders.MIMETYPES[format])
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="%prog [options]", description="Serve Steam profile cards and signatures over HTTP.")
+    parser.add_option("--host", default="127.0.0.1", help="address to listen on [%default]")
+    parser.add_option("-p", "--port", type="int", default=8080, help="port to listen on [%default]")
+    parser.add_option("--template", default="default", help="template name [%default]")
+    parser.add_option("--render-workers", type="int", help="images drawn at once [one per core]")
+    parser.add_option("--fetch-workers", type="int", default=16, help="upstream fetches at once [%default]")
+    parser.add_option("--queue-timeout", type="float", default=0.5, help="seconds to wait for a free worker [%default]")
+    parser.add_option("--format", default="png", choices=sorted(encoders.MIMETYPES), help="output image format [%default]")
+    parser.add_option("--metrics", action="store_true", help="serve render stage metrics at /metrics")
+    parser.add_option("--statsd", metavar="HOST:PORT", help="send render stage metrics to a StatsD server")
+    parser.add_option("--memory-limit", type="int", metavar="MB", help="memory budget for caches and renders in flight")
+    parser.add_option("--replay", metavar="ARCHIVE", help="answer from a recorded fixture archive instead of Steam")
+    parser.add_option("--latency", type="float", default=0, help="seconds added to every replayed call [%default]")
+    parser.add_option("--error-rate", type="float", default=0, help="share of replayed calls that fail [%default]")
+    parser.add_option("--watch", metavar="FILE", help="keep the profiles listed in FILE rendered ahead of time")
+    options, args = parser.parse_args(argv)
+    encodings = {'card': (options.format, {}), 'sig': (options.format, {})}
+    if options.memory_limit:
+        memory.install(memory.MemoryGovernor(options.memory_limit * 1024 * 1024))
+    metrics = None
+    if options.metrics:
+        metrics = PrometheusSink()
+        instrumentation.add(metrics)
+    if options.statsd:
+        host, _, port = options.statsd.rpartition(":")
+        if not host or not port.isdigit():
+            parser.error("--statsd needs HOST:PORT")
+        instrumentation.add(StatsdSink(host, int(port)))
+    source = None
+    if options.replay:
+        source = ReplaySource(options.replay, options.latency, error_rate=options.error_rate)
+    scheduler = None
+    if options.watch:
+        scheduler = RefreshScheduler(template=options.template, encodings=encodings, source=source)
+        for steamuserid in readIds(options.watch):
+            scheduler.watch(steamuserid)
+        scheduler.start()
+    app = ProfileCardApp(options.template, options.render_workers, options.fetch_workers, options.queue_timeout,
+                         encodings, metrics, scheduler.store if scheduler else None, source)
+    server = make_server(options.host, options.port, app, server_class=ThreadingWSGIServer)
+    sys.stderr.write("Serving on http://%s:%d/\n" % (options.host, options.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    if scheduler:
+        scheduler.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
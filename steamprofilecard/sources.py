@@ -0,0 +1,244 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Where SteamProfileCard gets profiles and asset images from.
+
+    SteamSource      The Steam Web API and CDN, the default.
+    RecordingSource  Passes through to another source and saves everything it
+                     returned to a fixture archive.
+    ReplaySource     Answers from a fixture archive, with optional latency and
+                     injected errors, for load tests that don't touch Steam.
+
+A fixture archive is a zip file, or a directory, holding profiles.json and an
+assets directory, the layout of benchmarks/fixtures. profiles.json maps each
+steamuserid to {"user": {...}, "group": {...} or null} with the steamwebapi
+attributes, and assets holds every image under the last part of its url.
+"""
+import io, json, os, random, socket, threading, time, zipfile
+
+from steamwebapi import profiles
+
+from steamprofilecard.connpool import asset_pool
+
+class ReplayError(IOError):
+    """
+    Raised by ReplaySource for data missing from the archive and for injected errors.
+    """
+
+class DataSource:
+    # Sources that have to see every lookup, like RecordingSource, set this so
+    # SteamProfileCard neither reads nor fills the shared caches for them.
+    bypass_cache = False
+
+    def getUserProfile(self, steamuserid):
+        """
+        Returns the steamwebapi User for steamuserid.
+        """
+        raise NotImplementedError
+
+    def getGroupProfile(self, groupid):
+        """
+        Returns the steamwebapi Group for groupid.
+        """
+        raise NotImplementedError
+
+    def getAsset(self, url, timeout):
+        """
+        Returns the bytes of the image at url, waiting at most timeout seconds.
+        """
+        raise NotImplementedError
+
+class SteamSource(DataSource):
+    def __init__(self, pool=None):
+        """
+        Looks profiles up with steamwebapi and downloads assets through pool,
+        the shared asset_pool by default.
+        """
+        self.pool = pool
+
+    def getUserProfile(self, steamuserid):
+        return profiles.get_user_profile(steamuserid)
+
+    def getGroupProfile(self, groupid):
+        return profiles.get_group_profile(groupid)
+
+    def getAsset(self, url, timeout):
+        return (self.pool or asset_pool).get(url, timeout=timeout)
+
+def assetName(url):
+    """
+    Returns the name an asset is stored under in a fixture archive.
+    """
+    return url.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+
+def _attributes(profile):
+    """
+    Returns the attributes of a steamwebapi object that are set, without the
+    underscore of the ones behind properties, so they can be set back as is.
+    """
+    return dict((name.lstrip("_"), value) for name, value in vars(profile).items() if value is not None)
+
+class RecordingSource(DataSource):
+    bypass_cache = True
+
+    def __init__(self, path, source=None):
+        """
+        Answers from source, a SteamSource by default, and keeps what it returned
+        so save() can write it to the fixture archive at path. Cards drawn from
+        it skip the shared caches, so everything they need is recorded.
+        """
+        self.path = path
+        self.source = source or SteamSource()
+        self.users = {}
+        self.groups = {}
+        self.assets = {}
+        self._lock = threading.Lock()
+
+    def getUserProfile(self, steamuserid):
+        user = self.source.getUserProfile(steamuserid)
+        with self._lock:
+            self.users[steamuserid] = _attributes(user)
+        return user
+
+    def getGroupProfile(self, groupid):
+        group = self.source.getGroupProfile(groupid)
+        if group is not None:
+            with self._lock:
+                self.groups[str(groupid)] = _attributes(group)
+        return group
+
+    def getAsset(self, url, timeout):
+        data = self.source.getAsset(url, timeout)
+        with self._lock:
+            self.assets[assetName(url)] = data
+        return data
+
+    def save(self):
+        """
+        Writes everything recorded so far to the zip archive at self.path.
+        """
+        with self._lock:
+            recorded = {}
+            for steamuserid, user in self.users.items():
+                recorded[steamuserid] = {'user': user, 'group': self.groups.get(str(user.get('primaryclanid')))}
+            assets = dict(self.assets)
+        archive = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            archive.writestr("profiles.json", json.dumps(recorded, indent=2, sort_keys=True))
+            for name in sorted(assets):
+                archive.writestr("assets/" + name, assets[name])
+        finally:
+            archive.close()
+
+class ReplaySource(DataSource):
+    def __init__(self, path, latency=0, asset_latency=None, jitter=0, error_rate=0, asset_error_rate=None, seed=None):
+        """
+        Answers from the fixture archive at path, a zip file or a directory, which
+        is read into memory once. Every profile lookup takes latency seconds and
+        every asset asset_latency (default latency), plus up to jitter seconds
+        at random. error_rate and asset_error_rate (default error_rate) are the
+        chances that a call raises a ReplayError instead. seed makes the
+        jitter and errors repeatable.
+        """
+        self.latency = latency
+        self.asset_latency = latency if asset_latency is None else asset_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.asset_error_rate = error_rate if asset_error_rate is None else asset_error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.users, self.assets = self.__load(path)
+        self.groups = {}
+        for steamuserid, entry in self.users.items():
+            if entry.get('group'):
+                self.groups[str(entry['user'].get('primaryclanid'))] = entry['group']
+
+    # Batch workers get a pickled copy, which needs a lock of its own.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __load(self, path):
+        if os.path.isdir(path):
+            with io.open(os.path.join(path, "profiles.json"), encoding="utf-8") as f:
+                recorded = json.load(f)
+            assets = {}
+            assetdir = os.path.join(path, "assets")
+            for name in os.listdir(assetdir) if os.path.isdir(assetdir) else []:
+                with open(os.path.join(assetdir, name), 'rb') as f:
+                    assets[name] = f.read()
+            return recorded, assets
+        archive = zipfile.ZipFile(path)
+        try:
+            recorded = json.loads(archive.read("profiles.json").decode("utf-8"))
+            assets = dict((name[len("assets/"):], archive.read(name)) for name in archive.namelist()
+                          if name.startswith("assets/") and not name.endswith("/"))
+        finally:
+            archive.close()
+        return recorded, assets
+
+    def __wait(self, latency, error_rate, timeout=None):
+        """
+        Sleeps for the synthetic latency and raises the injected errors. Raises
+        socket.timeout after timeout seconds if the latency is longer.
+        """
+        with self._lock:
+            delay = latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < error_rate
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise socket.timeout("timed out")
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ReplayError("injected error")
+
+    def getUserProfile(self, steamuserid):
+        self.__wait(self.latency, self.error_rate)
+        entry = self.users.get(steamuserid)
+        if entry is None:
+            raise ReplayError("no recorded profile for %s" % steamuserid)
+        user = profiles.User()
+        for name, value in entry['user'].items():
+            setattr(user, name, value)
+        return user
+
+    def getGroupProfile(self, groupid):
+        self.__wait(self.latency, self.error_rate)
+        attributes = self.groups.get(str(groupid))
+        if attributes is None:
+            raise ReplayError("no recorded group for %s" % groupid)
+        group = profiles.Group()
+        for name, value in attributes.items():
+            setattr(group, name, value)
+        return group
+
+    def getAsset(self, url, timeout):
+        self.__wait(self.asset_latency, self.asset_error_rate, timeout)
+        data = self.assets.get(assetName(url))
+        if data is None:
+            raise ReplayError("no recorded asset for %s" % url)
+        return data
+
+steam_source = SteamSource()
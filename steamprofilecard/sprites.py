@@ -0,0 +1,134 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Small graphics pasted onto profile images. They only depend on their arguments,
+so each one is drawn once and kept in the shared sprite or text cache.
+"""
+from PIL import Image, ImageDraw, ImageChops
+
+from steamprofilecard.cache import sprite_cache, text_cache
+from steamprofilecard.resources import resources
+
+def trim(im):
+    bg = Image.new(im.mode, im.size, im.getpixel((0,0)))
+    diff = ImageChops.difference(im, bg)
+    diff = ImageChops.add(diff, diff, 2.0, -100)
+    bbox = diff.getbbox()
+    if bbox:
+        return im.crop(bbox)
+
+def onlineState(color):
+    """
+    Draws a circle and returns a PIL image 5x5 with the color specified. This is to
+    draw a nice smooth circle since PIL can't do it by default. The circle is
+    kept in the shared sprite cache, so the returned image must not be modified.
+    """
+    key = ("status", color)
+    state = sprite_cache.get(key)
+    if state is None:
+        image = Image.new("RGBA", (100,100), color=(255, 255, 255, 0))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((0, 0, 100, 100), fill=color, outline="#000000")
+        state = image.resize((5,5), Image.ANTIALIAS)
+        sprite_cache.set(key, state, 5 * 5 * 4)
+    return state
+
+def steamLevel(steam_level, circle_color='#00FF00', text_color='#FFFFFF', img_size=29):
+    """
+    Creates a small circle with the users steam level. The badge is kept in the
+    shared sprite cache, so the returned image must not be modified.
+    """
+    key = ("level", steam_level, circle_color, text_color, img_size)
+    circle = sprite_cache.get(key)
+    if circle is not None:
+        return circle
+
+    # Final Steam Level image width and height
+    sl_w = img_size
+    sl_h = img_size
+
+    image = Image.new("RGBA", (101,101), color=(255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((0, 0, 100, 100), fill=circle_color, outline=(255, 255, 255, 0))
+    draw.ellipse((5, 5, 95, 95), fill=(255, 255, 255, 0), outline=(255, 255, 255, 0))
+    circle = image.resize((sl_w,sl_h), Image.ANTIALIAS)
+
+    # Attempting to center text directly will often be a few pixels off
+    # in any direction due to how most fonts have varying heights for
+    # characters. ImageFont.getsize doesn't return the actual height of
+    # the 'visible' printed characters, but includes whitespace from the 
+    # font. To get around this, the text is written on a separate image and
+    # then that image is trimmed of all the empty space. This gets the
+    # correct width and height of the 'visible' text.
+    sl_font = resources.font("level")
+    w, h = sl_font.getsize(steam_level)
+
+    text_img = Image.new("RGBA", (100,100), color=(255, 255, 255, 0))
+    text_draw = ImageDraw.Draw(text_img)
+    text_draw.text(((100-w)/2,(100-h)/2), steam_level, fill=text_color, font=sl_font)
+    text_trim = trim(text_img)
+
+    w, h = text_trim.size
+    # Max width = 23
+    max_w = sl_w-6
+    if w > max_w:
+        width_percent = (max_w/float(w))
+        new_h = int((float(h)*float(width_percent)))
+        text_trim = text_trim.resize((max_w,new_h), Image.ANTIALIAS)
+        w, h = text_trim.size
+
+    circle.paste(text_trim, (int((sl_w-w)/2),int((sl_h-h)/2)) , text_trim)
+    sprite_cache.set(key, circle, sl_w * sl_h * 4)
+    return circle
+
+def textMask(text, font):
+    """
+    Rasterizes text in font once and returns it as an "L" mask with the offset
+    of its top left corner from the text position, or None for text that draws
+    nothing. The mask is kept in the shared text cache and must not be modified.
+    """
+    key = ("text", text, font)
+    entry = text_cache.get(key)
+    if entry is not None:
+        return entry
+    if hasattr(font, 'getbbox'):
+        left, upper, right, lower = font.getbbox(text)
+    else:
+        left, upper = 0, 0
+        right, lower = font.getsize(text)
+    if right <= left or lower <= upper:
+        return None
+    mask = Image.new("L", (right - left, lower - upper), 0)
+    # Drawing full ink onto black leaves exactly the glyph coverage in the mask.
+    ImageDraw.Draw(mask).text((-left, -upper), text, fill=255, font=font)
+    entry = (mask, (left, upper))
+    text_cache.set(key, entry, mask.size[0] * mask.size[1])
+    return entry
+
+def drawText(image, pos, text, font, fill="#FFFFFF"):
+    """
+    Draws text onto image at pos like ImageDraw.text(), pasting a cached mask so
+    the glyphs of a string are only rasterized the first time it is drawn.
+    """
+    entry = textMask(text, font)
+    if entry is None:
+        return
+    mask, (left, upper) = entry
+    x, y = pos[0] + left, pos[1] + upper
+    image.paste(fill, (x, y, x + mask.size[0], y + mask.size[1]), mask)
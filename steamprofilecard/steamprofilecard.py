@@ -17,78 +17,83 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-import sys
-
-PYMAJORVER, PYMINORVER, PYMICROVER, PYRELEASELEVEL, PYSERIAL = sys.version_info
-if PYMAJORVER == 3 and PYMINORVER >= 2:
-    #Python >= 3.2
-    from urllib.request import urlopen
-elif PYMAJORVER == 2 and PYMINORVER == 7:
-    #Python 2.7
-    from urllib2 import urlopen
-elif PYMAJORVER == 2 and PYMINORVER == 6:
-    #Python 2.6
-    from urllib2 import urlopen
-else:
-    raise RuntimeError("Python Version 2.6 or greater required.")
-
-import io, re, os
-from datetime import datetime
+import hashlib, io, re
 import xml.etree.ElementTree as ET
-from PIL import Image, ImageFont, ImageDraw, ImageChops
-
-from steamwebapi import profiles
-
-TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+from PIL import Image
 
-FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+from steamprofilecard import encoders, memory
+from steamprofilecard.assets import AssetFetcher, ASSET_TIMEOUT
+# TEMPLATE_PATH and FONT_PATH used to be defined here and are still importable from this module.
+from steamprofilecard.resources import resources, TEMPLATE_PATH, FONT_PATH
+from steamprofilecard.cache import image_cache, profile_cache, render_cache, composition_cache
+from steamprofilecard.instrument import instrumentation
+from steamprofilecard.layout import compileLayout, profileFields
+from steamprofilecard.records import ProfileRecord, GroupRecord
+from steamprofilecard.sources import steam_source
+# trim used to be defined here and is still importable from this module.
+from steamprofilecard.sprites import drawText, trim
 
-fontlarge = ImageFont.truetype(os.path.join(FONT_PATH, "FreeSansBold.ttf"), 12, encoding="unic")
-font = ImageFont.truetype(os.path.join(FONT_PATH, "FreeSansBold.ttf"), 8, encoding="unic")
-sl_font = ImageFont.truetype(os.path.join(FONT_PATH, "slkscr.ttf"), 15, encoding="unic")
+# Bump whenever a change to the drawing code changes the output for the same
+# profile, so images in the render cache are not reused.
+RENDER_VERSION = 1
 
-def trim(im):
-    bg = Image.new(im.mode, im.size, im.getpixel((0,0)))
-    diff = ImageChops.difference(im, bg)
-    diff = ImageChops.add(diff, diff, 2.0, -100)
-    bbox = diff.getbbox()
-    if bbox:
-        return im.crop(bbox)
+def etagMatches(if_none_match, etag):
+    """
+    Returns True if the value of an If-None-Match header matches etag.
+    """
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
 
 class SteamProfileCard:
-    def __init__(self, steamuserid, imgtype, template):
+    def __init__(self, steamuserid, imgtype, template, asset_timeout=ASSET_TIMEOUT, source=None):
+        """
+        source is the steamprofilecard.sources.DataSource profiles and assets come
+        from, the Steam Web API and CDN by default. Profiles and assets are
+        cached by steamuserid and url whatever source they came from, except
+        for sources with bypass_cache set, which don't use the shared caches.
+        """
         self.steamuserid = steamuserid
         self.imgtype = self.__profileImgType(imgtype)
         self.template = template
+        self.source = source or steam_source
+        self.assetFetcher = AssetFetcher(asset_timeout, source=self.source)
+        self.assetsComplete = True
         self.profileGrabStatus = True
         try:
-            self.user_profile = profiles.get_user_profile(steamuserid)
-            if self.user_profile.primaryclanid:
-                # Group ID '103582791429521408' is often encountered.
-                # In hex, that ID is '0x170000000000000' which has 0 in the 
-                # lower 32bits. There is no actual group ID, just the universe,
-                # account type identifiers, and the instance.
-                # https://developer.valvesoftware.com/wiki/SteamID
-                if (int(self.user_profile.primaryclanid) & 0x00000000FFFFFFFF) != 0:
-                    self.primary_group_profile = profiles.get_group_profile(self.user_profile.primaryclanid)
+            with instrumentation.stage("profile", imgtype=self.imgtype):
+                if self.source.bypass_cache:
+                    self.user_profile, self.primary_group_profile = self.__fetchProfiles(steamuserid)
                 else:
-                    self.primary_group_profile = None
-            else:
-                self.primary_group_profile = None
-        except:
+                    self.user_profile, self.primary_group_profile = profile_cache.get(steamuserid, self.__fetchProfiles)
+        except Exception:
             self.profileGrabStatus = False
 
-    def __get_2wk_playtime(self):
+    def __fetchProfiles(self, steamuserid):
         """
-        Adds up playtime in each of the games in user_profile.recentlyplayedgames
-        and returns the total.
+        Looks up the user profile and, if there is one, the primary group profile
+        from the data source. Returns them as a (ProfileRecord, GroupRecord) tuple, the
+        group None if there is none. Called through the shared profile cache so
+        hot profiles don't hit the Steam API every time.
         """
-        games = self.user_profile.recentlyplayedgames
-        minutes = 0
-        for game in games:
-            minutes += game['playtime_2weeks']
-        return ((minutes + 60 // 2) // 60)
-    
+        user_profile = self.source.getUserProfile(steamuserid)
+        primary_group_profile = None
+        if user_profile.primaryclanid:
+            # Group ID '103582791429521408' is often encountered.
+            # In hex, that ID is '0x170000000000000' which has 0 in the 
+            # lower 32bits. There is no actual group ID, just the universe,
+            # account type identifiers, and the instance.
+            # https://developer.valvesoftware.com/wiki/SteamID
+            if (int(user_profile.primaryclanid) & 0x00000000FFFFFFFF) != 0:
+                primary_group_profile = self.source.getGroupProfile(user_profile.primaryclanid)
+        if primary_group_profile is not None:
+            primary_group_profile = GroupRecord.fromGroup(primary_group_profile)
+        return ProfileRecord.fromUser(user_profile), primary_group_profile
+
     def __profileImgType(self, imgtype):
         """
         Will make sure the imgtype is either "card" or "sig". Will default to "card" if not.
@@ -105,213 +110,87 @@ class SteamProfileCard:
             self.imgsize = (210, 150)
             return imgtype
 
-    def __onlineStateDraw(self, color):
-        """
-        Draws a circle and returns a PIL image 5x5 with the color specified. This is to
-        draw a nice smooth circle since PIL can't do it by default.
-        """
-        image = Image.new("RGBA", (100,100), color=(255, 255, 255, 0))
-        draw = ImageDraw.Draw(image)
-        draw.ellipse((0, 0, 100, 100), fill=color, outline="#000000")
-        state = image.resize((5,5), Image.ANTIALIAS)
-        return state
-
-    def __drawSteamLevel(self, steam_level, circle_color='#00FF00', text_color='#FFFFFF', img_size=29):
+    def __loadAssets(self, requests):
         """
-        Creates a small circle with the users steam level
+        Returns a dict of (url, size) to PIL image for the requested assets. Images
+        already in the shared image cache are used as is, the rest are downloaded
+        together by the AssetFetcher, decoded, resized and added to the cache.
+        Assets that didn't arrive in time or couldn't be decoded are left out.
         """
-        # Final Steam Level image width and height
-        sl_w = img_size
-        sl_h = img_size
-
-        image = Image.new("RGBA", (101,101), color=(255, 255, 255, 0))
-        draw = ImageDraw.Draw(image)
-        draw.ellipse((0, 0, 100, 100), fill=circle_color, outline=(255, 255, 255, 0))
-        draw.ellipse((5, 5, 95, 95), fill=(255, 255, 255, 0), outline=(255, 255, 255, 0))
-        circle = image.resize((sl_w,sl_h), Image.ANTIALIAS)
-
-        # Attempting to center text directly will often be a few pixels off
-        # in any direction due to how most fonts have varying heights for
-        # characters. ImageFont.getsize doesn't return the actual height of
-        # the 'visible' printed characters, but includes whitespace from the 
-        # font. To get around this, the text is written on a separate image and
-        # then that image is trimmed of all the empty space. This gets the
-        # correct width and height of the 'visible' text.
-        w, h = sl_font.getsize(steam_level)
+        images = {}
+        missing = []
+        for url, size in requests:
+            image = None
+            if not self.source.bypass_cache:
+                image = image_cache.getImage(url, size)
+            if image is not None:
+                images[(url, size)] = image
+            elif url:
+                missing.append((url, size))
 
-        text_img = Image.new("RGBA", (100,100), color=(255, 255, 255, 0))
-        text_draw = ImageDraw.Draw(text_img)
-        text_draw.text(((100-w)/2,(100-h)/2), steam_level, fill=text_color, font=sl_font)
-        text_trim = trim(text_img)
-
-        w, h = text_trim.size
-        # Max width = 23
-        max_w = sl_w-6
-        if w > max_w:
-            width_percent = (max_w/float(w))
-            new_h = int((float(h)*float(width_percent)))
-            text_trim = text_trim.resize((max_w,new_h), Image.ANTIALIAS)
-            w, h = text_trim.size
-
-        circle.paste(text_trim, (int((sl_w-w)/2),int((sl_h-h)/2)) , text_trim)
-        return circle
+        if missing:
+            downloads = self.assetFetcher.fetch([url for url, size in missing])
+            for url, size in missing:
+                if url not in downloads:
+                    continue
+                try:
+                    with instrumentation.stage("asset_decode", url=url) as stage:
+                        stage.nbytes = len(downloads[url])
+                        image = Image.open(io.BytesIO(downloads[url]))
+                        if size:
+                            image = image.resize(size, Image.ANTIALIAS)
+                        else:
+                            image.load()
+                except Exception:
+                    continue
+                if not self.source.bypass_cache:
+                    image_cache.setImage(url, size, image)
+                images[(url, size)] = image
+        self.assetsComplete = len(images) == len([url for url, size in requests if url])
+        return images
 
-    def __loadBaseTemplateImg(self, template):
+    def prefetchAssets(self):
         """
-        Will load the base template for the profile card based on input. If the
-        template can't be found a blank image will be used. If the type of card isn't
-        valid (card|sig) the "card" type will be used. Returns a PIL image object.
+        Downloads the images the profile needs into the shared image cache without
+        drawing anything, so network waits can be kept apart from the drawing work.
+        Returns True if every asset arrived.
         """
-        imageloaded = False
-        templatefile = os.path.join(TEMPLATE_PATH, self.imgtype, template + ".png")
-        if os.path.isfile(templatefile):
-            try:
-                with open(templatefile, 'rb') as f:
-                    image = Image.open(f).convert("RGB")
-                    if image.size == self.imgsize:
-                        imageloaded = True
-            except:
-                pass
-        if imageloaded == False:
-            image = Image.new("RGB", self.imgsize, color="#808080")
-        return image
-        
-    def __publicProfileCardDraw(self):
-        """
-        Draws a new profile "card" type with PIL based on Steam User Info. Returns a PIL image object.
-        """
-        image = self.__loadBaseTemplateImg(self.template)
-        draw = ImageDraw.Draw(image)
-        
-        
-        draw.text((73,35), self.user_profile.personaname, font=fontlarge)
-        txttowrt = "Joined: %s"  % (datetime.utcfromtimestamp(int(self.user_profile.timecreated)).strftime('%B %d, %Y'))
-        draw.text((65,52), txttowrt, font=font)
-        txttowrt = "Steam Level: %s" % (self.user_profile.steamlevel)
-        draw.text((65,62), txttowrt, font=font)
-        txttowrt = "Played: %s hrs past 2 weeks" % (self.__get_2wk_playtime())
-        draw.text((65,72), txttowrt, font=font)
+        if self.profileGrabStatus and not self.user_profile.communityvisibilitystate == "Private":
+            layout = compileLayout(self.imgtype, self.template, self.imgsize)
+            self.__loadAssets(layout.assetRequests(profileFields(self.user_profile, self.primary_group_profile)))
+        return self.assetsComplete
 
-        if self.user_profile.personastate in ['Online', 'Looking to Trade', 'Looking to Play']:
-            statusimage = self.__onlineStateDraw("#00FF00")
-        elif self.user_profile.personastate in ['Away', 'Snooze']:
-            statusimage = self.__onlineStateDraw("#FF9933")
-        elif self.user_profile.personastate in ['Busy']:
-            statusimage = self.__onlineStateDraw("#FF0000")
-        else:
-            statusimage = self.__onlineStateDraw("#A3A3A3")
-        image.paste(statusimage, (65, 40), statusimage)
-        
-        steam_level_image = self.__drawSteamLevel(str(self.user_profile.steamlevel))
-        image.paste(steam_level_image, (176, 5), steam_level_image)
-        
-        try:
-            avatarIM = Image.open(io.BytesIO(urlopen(self.user_profile.avatarmedium).read())).resize((55,55), Image.ANTIALIAS)
-            image.paste(avatarIM, (5,35))
-        except:
-            pass
-        
-        if self.primary_group_profile:
-            try:
-                groupIM = Image.open(io.BytesIO(urlopen(self.primary_group_profile.avataricon).read())).resize((20, 20), Image.ANTIALIAS)
-                image.paste(groupIM, (5,5))
-            except:
-                pass
-            txttowrt = "\"%s\" Member" % (self.primary_group_profile.groupname)
-            draw.text((5, 90), txttowrt, font=font)
-            if self.user_profile.profileurlname:
-                draw.text((30,7), self.user_profile.profileurlname, font=fontlarge)
-        else:
-            if self.user_profile.profileurlname:
-                draw.text((5,7), self.user_profile.profileurlname, font=fontlarge)
-            
-        if len(self.user_profile.recentlyplayedgames) > 0:
-            try:
-                firstgameIM = Image.open(io.BytesIO(urlopen(self.user_profile.recentlyplayedgames[0]['img_icon_url']).read()))
-                image.paste(firstgameIM, (5,112))
-            except:
-                pass
-            txttowrt = (self.user_profile.recentlyplayedgames[0]['name'][:23] + "...") if len(self.user_profile.recentlyplayedgames[0]['name']) > 25 else self.user_profile.recentlyplayedgames[0]['name']
-            draw.text((40, 112), txttowrt, font=font)
-            txttowrt = "%s hours" % ((self.user_profile.recentlyplayedgames[0]['playtime_2weeks']+60//2)//60)
-            draw.text((40,122), txttowrt, font=font)
-            xoffset = 138
-
-            for game in self.user_profile.recentlyplayedgames[1:3]:
-                try:
-                    gameIcon = Image.open(io.BytesIO(urlopen(game['img_icon_url']).read()))
-                    image.paste(gameIcon, (xoffset,112))
-                    xoffset = xoffset + 35
-                except:
-                    pass
-                
-
-        return image
-    
-    def __publicProfileSigDraw(self):
+    def __publicProfileDraw(self):
         """
-        Draws a new profile "sig" type with PIL based on Steam User Info. Returns a PIL image object.
+        Draws a new profile "card" or "sig" type with PIL based on Steam User Info,
+        using the compiled layout for the imgtype and template. Returns a PIL image object.
         """
-        image = self.__loadBaseTemplateImg(self.template)
-        draw = ImageDraw.Draw(image)
-        
-        try:
-            avatarIM = Image.open(io.BytesIO(urlopen(self.user_profile.avatarmedium).read())).resize((40,40), Image.ANTIALIAS)
-            image.paste(avatarIM, (5,5))
-        except:
-            pass
-        
-        if self.user_profile.personastate == "Online" or self.user_profile.personastate == "Snooze":
-            statusimage = self.__onlineStateDraw("#00FF00")
-        else:
-            statusimage = self.__onlineStateDraw("#FF0000")
-        
-        
-        if self.primary_group_profile:
-            try:
-                groupIM = Image.open(io.BytesIO(urlopen(self.primary_group_profile.avataricon).read())).resize((20, 20), Image.ANTIALIAS)
-                image.paste(groupIM, (57,2))
-            except:
-                pass
-            image.paste(statusimage, (82, 9), statusimage)
-            draw.text((90,4), self.user_profile.personaname, font=fontlarge)
-        else:
-            image.paste(statusimage, (57, 9), statusimage)
-            draw.text((65,4), self.user_profile.personaname, font=fontlarge)
-        
-        txttowrt = "Steam Level: %s" % (self.user_profile.steamlevel)
-        draw.text((57,35), txttowrt, font=font)
-        
-        txttowrt = "Played: %s hrs past 2 weeks" % (self.__get_2wk_playtime())
-        draw.text((57,25), txttowrt, font=font)
-
-        # This doesn't look very good, and the entire sig needs to have a 
-        # new layout.
-        # steam_level_image = self.__drawSteamLevel(str(self.user_profile.steamlevel))
-        # image.paste(steam_level_image, (175, 7), steam_level_image)
-
-        xoffset = 325
-        for game in reversed(self.user_profile.recentlyplayedgames[:5]):
-            try:
-                gameIcon = Image.open(io.BytesIO(urlopen(game['img_icon_url']).read())).resize((20, 20), Image.ANTIALIAS)
-                image.paste(gameIcon, (xoffset,25))
-                xoffset = xoffset - 25
-            except:
-                pass
-            
-        
+        layout = compileLayout(self.imgtype, self.template, self.imgsize)
+        fields = profileFields(self.user_profile, self.primary_group_profile)
+        assets = self.__loadAssets(layout.assetRequests(fields))
+        with instrumentation.stage("draw_profile", imgtype=self.imgtype) as stage:
+            # The previous composition of this profile is kept so only the regions
+            # whose content changed have to be repainted.
+            key = (self.steamuserid, self.imgtype, self.template)
+            composition = layout.renderIncremental(fields, assets, composition_cache.get(key))
+            composition_cache.set(key, composition, self.imgsize[0] * self.imgsize[1] * 3)
+            # Callers may modify the returned image, the cached one has to stay intact.
+            image = composition.image.copy()
+            stage.nbytes = self.imgsize[0] * self.imgsize[1] * 3
         return image
-    
+
     def __profileErrorDraw(self, error):
         """
         If there was an error retrieving Steam user info this will draw an image to report the error.
         Returns a PIL image object.
         """
-        image = Image.new("RGB", self.imgsize)
-        draw = ImageDraw.Draw(image)
-        draw.text((10,10), "The Steam profile for custom URL: ", font=font)
-        draw.text((20,20), self.steamuserid, font=font)
-        draw.text((10,30), error, font=font)
+        with instrumentation.stage("draw_error", imgtype=self.imgtype) as stage:
+            font = resources.font("small")
+            image = Image.new("RGB", self.imgsize)
+            drawText(image, (10,10), "The Steam profile for custom URL: ", font)
+            drawText(image, (20,20), self.steamuserid, font)
+            drawText(image, (10,30), error, font)
+            stage.nbytes = self.imgsize[0] * self.imgsize[1] * 3
         return image
     
     def drawProfileImg(self):
@@ -323,27 +202,101 @@ class SteamProfileCard:
         if self.profileGrabStatus == False:
             self.profileImage = self.__profileErrorDraw("had an error retrieving xml")
         elif not self.user_profile.communityvisibilitystate == "Private":
-            if self.imgtype == "card":
-                self.profileImage = self.__publicProfileCardDraw()
-            elif self.imgtype == "sig":
-                self.profileImage = self.__publicProfileSigDraw()
+            self.profileImage = self.__publicProfileDraw()
         elif self.user_profile.personaname:
             self.profileImage = self.__profileErrorDraw("is not public.")
         else:
             self.profileImage = self.__profileErrorDraw("doesn't exist.")
         return self.profileImage
     
-    def imageToWeb(self):
+    def imageToWeb(self, format="png", **options):
         """
-        Will attempt to save the generated PIL image object as a PNG stream so it can be include in web output.
+        Will attempt to encode the generated PIL image object so it can be include in web output.
+        The format and its options are described in steamprofilecard.encoders, the default is PNG.
+        The EncodedImage, with the encoded size and time, is kept as self.encodedImage.
+        Returns False if encoding failed, the error is reported to the instrumentation.
         """
-        self.imgStream = io.BytesIO()
         try:
-            self.profileImage.save(self.imgStream, "PNG")
-        except:
+            with instrumentation.stage("encode", imgtype=self.imgtype, format=format) as stage:
+                self.encodedImage = encoders.encode(self.profileImage, format, **options)
+                stage.nbytes = self.encodedImage.size
+        except Exception:
+            return False
+        return self.encodedImage.data
+
+    def fingerprint(self):
+        """
+        Returns a hex digest of every input that affects the pixels of the drawn
+        image: the image type and template, the profile fields that are drawn and
+        the urls of the pasted assets. Steam CDN urls contain a hash of the image,
+        so a changed avatar or icon also changes the fingerprint. Error images
+        draw the steamuserid they were asked for, so it is part of theirs.
+        """
+        inputs = [RENDER_VERSION, self.imgtype, self.template, self.profileGrabStatus]
+        if self.profileGrabStatus == False:
+            inputs.append(self.steamuserid)
+        elif self.user_profile.communityvisibilitystate == "Private":
+            inputs.extend([self.steamuserid, self.user_profile.personaname])
+        else:
+            user = self.user_profile
+            inputs.extend([user.communityvisibilitystate, user.personaname, user.personastate,
+                           user.profileurlname, user.timecreated, user.steamlevel, user.avatarmedium])
+            for game in user.recentlyplayedgames or []:
+                inputs.append((game.get('name'), game.get('playtime_2weeks'), game.get('img_icon_url')))
+            if self.primary_group_profile:
+                inputs.extend([self.primary_group_profile.groupname, self.primary_group_profile.avataricon])
+        return hashlib.sha1(repr(inputs).encode("utf-8")).hexdigest()
+
+    def etag(self, format="png", **options):
+        """
+        Returns a strong ETag header value for the image this profile draws, encoded
+        in format with options. Returns None once a draw was missing assets, since
+        the complete image will have the same fingerprint.
+        """
+        if not self.assetsComplete:
+            return None
+        key = encoders.encodingKey(format, **options)
+        if key == "png":
+            return '"%s"' % self.fingerprint()
+        return '"%s-%s"' % (self.fingerprint(), hashlib.sha1(key.encode("utf-8")).hexdigest()[:8])
+
+    def notModified(self, if_none_match, format="png", **options):
+        """
+        Returns True if the value of an If-None-Match request header matches the
+        current ETag, meaning a 304 response can be sent without drawing anything.
+        """
+        etag = self.etag(format, **options)
+        if not if_none_match or etag is None:
             return False
-        self.imgStream.seek(0)
-        return self.imgStream.read()
+        return etagMatches(if_none_match, etag)
+
+    def cachedRender(self, format="png", **options):
+        """
+        Returns the encoded bytes for this profile from the shared render cache, or
+        None if it would have to be drawn.
+        """
+        if self.source.bypass_cache:
+            return None
+        return render_cache.get("%s|%s" % (self.fingerprint(), encoders.encodingKey(format, **options)))
+
+    def renderToWeb(self, format="png", **options):
+        """
+        Returns the encoded bytes for this profile, PNG unless another format is given.
+        The result is looked up in the shared render cache by fingerprint and
+        encoding first and only drawn and encoded on a miss. Images missing assets
+        that timed out aren't cached so a later request can draw them complete.
+        Drawing waits for a render slot if a memory governor is installed, and the
+        drawn image is released once it is encoded.
+        """
+        data = self.cachedRender(format, **options)
+        if data is None:
+            with memory.renderSlot():
+                self.drawProfileImg()
+                data = self.imageToWeb(format, **options)
+                del self.profileImage
+            if data and self.assetsComplete and not self.source.bypass_cache:
+                render_cache.setRender("%s|%s" % (self.fingerprint(), encoders.encodingKey(format, **options)), data)
+        return data
 
 def main():
     card = SteamProfileCard("vanityURL", "card", "default")
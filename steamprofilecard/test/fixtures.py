@@ -0,0 +1,78 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+"""
+Offline steamwebapi profiles for the tests. StubProfiles replaces the lookups in
+steamwebapi.profiles and counts how often each one is called.
+"""
+from steamwebapi import profiles
+
+from steamprofilecard.cache import profile_cache
+
+def make_user(server, delay=0, personastate=1, games=3):
+    user = profiles.User()
+    user.steamid = "76561197960287930"
+    user.communityvisibilitystate = 3
+    user.personaname = "Stub User"
+    user.personastate = personastate
+    user.profileurlname = "stubuser"
+    user.timecreated = 1063407589
+    user.primaryclanid = "103582791429521412"
+    user.avatarmedium = server.url("avatar.jpg", delay)
+    user.steamlevel = 42
+    user.recentlyplayedgames = []
+    for i in range(games):
+        user.recentlyplayedgames.append({
+            'appid': 570 + i,
+            'name': "Stub Game %s" % i,
+            'playtime_2weeks': 90 * (i + 1),
+            'img_icon_url': server.url("game%s.jpg" % i, delay),
+        })
+    return user
+
+def make_group(server, delay=0):
+    group = profiles.Group()
+    group.groupid = "103582791429521412"
+    group.groupname = "Stub Group"
+    group.avataricon = server.url("group.jpg", delay)
+    return group
+
+class StubProfiles:
+    def __init__(self, user, group=None):
+        self.user = user
+        self.group = group
+        self.user_calls = 0
+        self.group_calls = 0
+
+    def get_user_profile(self, user, steam_api_key=None):
+        self.user_calls += 1
+        return self.user
+
+    def get_group_profile(self, group, steam_api_key=None):
+        self.group_calls += 1
+        return self.group
+
+    def install(self):
+        self.saved = (profiles.get_user_profile, profiles.get_group_profile)
+        profiles.get_user_profile = self.get_user_profile
+        profiles.get_group_profile = self.get_group_profile
+        profile_cache.clear()
+
+    def uninstall(self):
+        profiles.get_user_profile, profiles.get_group_profile = self.saved
+        profile_cache.clear()
@@ -0,0 +1,170 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import sys, threading, time
+import unittest
+
+from steamwebapi import profiles
+
+from steamprofilecard.cache import image_cache, profile_cache, render_cache, composition_cache
+from steamprofilecard.sources import RecordingSource
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from steamprofilecard import aio
+
+class FakeResponse:
+    def __init__(self, body, delay):
+        self.body = body
+        self.delay = delay
+
+    def __aenter__(self):
+        return asyncio.sleep(self.delay, self)
+
+    def __aexit__(self, *args):
+        return asyncio.sleep(0)
+
+    def raise_for_status(self):
+        if self.body is None:
+            raise IOError("404 Not Found")
+
+    def read(self):
+        return asyncio.sleep(0, self.body)
+
+class FakeSession:
+    """
+    The part of aiohttp.ClientSession that aio uses, answering every url with
+    body after delay seconds, or a 404 for urls containing "missing".
+    """
+    def __init__(self, body, delay=0):
+        self.body = body
+        self.delay = delay
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return FakeResponse(None if "missing" in url else self.body, self.delay)
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio interface requires Python 3.5")
+class TestAsyncSteamProfileCard(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server, delay=200), make_group(self.server, delay=200))
+        self.stub.install()
+        for cache in (image_cache, render_cache, composition_cache):
+            cache.clear()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.stub.uninstall()
+        self.server.close()
+
+    def render(self, session=None, imgtype="card", source=None):
+        card = self.loop.run_until_complete(aio.AsyncSteamProfileCard.create("stubuser", imgtype, "default", session=session,
+                                                                             source=source))
+        return card, self.loop.run_until_complete(card.render())
+
+    def test_matches_sync_render(self):
+        card, data = self.render()
+        self.assertTrue(card.card.assetsComplete)
+        render_cache.clear()
+        composition_cache.clear()
+        self.assertEqual(data, SteamProfileCard("stubuser", "card", "default").renderToWeb())
+        # Another render is a render cache hit.
+        cached = render_cache.get("%s|png" % card.card.fingerprint())
+        self.assertTrue(self.render()[1] is cached)
+
+    def test_event_loop_keeps_running(self):
+        # No async def here, so the module still compiles where aio can't be used.
+        ticks = []
+        def tick():
+            ticks.append(time.time())
+            handle[0] = self.loop.call_later(0.01, tick)
+        handle = [self.loop.call_soon(tick)]
+        def gather(coroutines):
+            return self.loop.run_until_complete(asyncio.gather(*[self.loop.create_task(c) for c in coroutines]))
+        start = time.time()
+        cards = gather(aio.AsyncSteamProfileCard.create("stubuser", imgtype, "default") for imgtype in ("card", "sig"))
+        results = gather(card.render() for card in cards)
+        handle[0].cancel()
+        self.assertTrue(all(results))
+        # Assets at 200ms each are downloaded concurrently without stalling the loop.
+        self.assertTrue(time.time() - start < 1.0)
+        self.assertTrue(max(b - a for a, b in zip(ticks, ticks[1:])) < 0.15)
+
+    def test_expired_profiles_are_looked_up_in_executor(self):
+        self.render()
+        threads = []
+        def lookup(user, steam_api_key=None):
+            threads.append(threading.current_thread())
+            return self.stub.get_user_profile(user, steam_api_key)
+        fresh, stale = profile_cache.fresh, profile_cache.stale
+        profile_cache.fresh = profile_cache.stale = 0
+        profiles.get_user_profile = lookup
+        try:
+            self.render()
+        finally:
+            profiles.get_user_profile = self.stub.get_user_profile
+            profile_cache.fresh, profile_cache.stale = fresh, stale
+        self.assertEqual(len(threads), 1)
+        self.assertFalse(threads[0] is threading.main_thread())
+
+    def test_recording_lookups_run_in_executor(self):
+        self.render()
+        threads = []
+        def lookup(user, steam_api_key=None):
+            threads.append(threading.current_thread())
+            return self.stub.get_user_profile(user, steam_api_key)
+        profiles.get_user_profile = lookup
+        try:
+            self.render(source=RecordingSource("unused.zip"))
+        finally:
+            profiles.get_user_profile = self.stub.get_user_profile
+        self.assertEqual(len(threads), 1)
+        self.assertFalse(threads[0] is threading.main_thread())
+
+    def test_session_is_used_for_assets(self):
+        session = FakeSession(self.server.body, delay=0.05)
+        card, data = self.render(session)
+        self.assertTrue(data)
+        self.assertEqual(len(session.urls), 5)
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(card.card.assetsComplete)
+
+    def test_failed_and_late_assets_are_skipped(self):
+        session = FakeSession(self.server.body, delay=0.05)
+        self.stub.user.avatarmedium = "http://example.invalid/missing.jpg"
+        downloads = self.loop.run_until_complete(aio.fetchAssets(
+            ["http://example.invalid/a.jpg", self.stub.user.avatarmedium], 1, session))
+        self.assertEqual(list(downloads), ["http://example.invalid/a.jpg"])
+        session.delay = 2
+        start = time.time()
+        downloads = self.loop.run_until_complete(aio.fetchAssets(["http://example.invalid/b.jpg"], 0.2, session))
+        self.assertEqual((downloads, time.time() - start < 1), ({}, True))
+
+        card, data = self.render(FakeSession(self.server.body))
+        self.assertTrue(data)
+        self.assertFalse(card.card.assetsComplete)
+
+if __name__ == '__main__':
+    unittest.main()
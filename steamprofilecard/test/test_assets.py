@@ -0,0 +1,85 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import time
+import unittest
+
+from steamprofilecard.assets import AssetFetcher
+from steamprofilecard.cache import image_cache
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestAssetFetcher(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_fetches_concurrently(self):
+        urls = [self.server.url("icon%s.png" % i, delay=300) for i in range(5)]
+        start = time.time()
+        assets = AssetFetcher(timeout=5).fetch(urls)
+        elapsed = time.time() - start
+        self.assertEqual(sorted(assets), sorted(urls))
+        self.assertEqual(assets[urls[0]], self.server.body)
+        # Sequential downloads would take at least 1.5 seconds.
+        self.assertTrue(elapsed < 1.2, elapsed)
+
+    def test_slow_assets_are_dropped(self):
+        fast = self.server.url("fast.png")
+        slow = self.server.url("slow.png", delay=2000)
+        start = time.time()
+        assets = AssetFetcher(timeout=0.5).fetch([fast, slow])
+        self.assertTrue(time.time() - start < 1.5)
+        self.assertEqual(list(assets), [fast])
+
+    def test_failed_and_empty_urls_are_skipped(self):
+        assets = AssetFetcher(timeout=1).fetch([None, "", "http://127.0.0.1:1/missing.png"])
+        self.assertEqual(assets, {})
+
+class TestCardAssets(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server, delay=200), make_group(self.server, delay=200))
+        self.stub.install()
+        image_cache.clear()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_card_renders_with_assets_in_parallel(self):
+        for imgtype in ("card", "sig"):
+            profile = SteamProfileCard("stubuser", imgtype, "default")
+            start = time.time()
+            image = profile.drawProfileImg()
+            # Five assets at 200ms each would take a full second in sequence.
+            self.assertTrue(time.time() - start < 0.8)
+            self.assertEqual(image.size, profile.imgsize)
+
+    def test_card_renders_without_late_assets(self):
+        self.stub.user.avatarmedium = self.server.url("avatar.jpg", delay=2000)
+        profile = SteamProfileCard("stubuser", "card", "default", asset_timeout=0.5)
+        start = time.time()
+        image = profile.drawProfileImg()
+        self.assertTrue(time.time() - start < 1.5)
+        self.assertEqual(image.getpixel((5, 112)), (51, 102, 153))
+        self.assertNotEqual(image.getpixel((30, 60)), (51, 102, 153))
@@ -0,0 +1,81 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import os, shutil, tempfile, zipfile
+import unittest
+
+from steamprofilecard import batch, memory
+from steamprofilecard.cache import image_cache
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class BrokenStubProfiles(StubProfiles):
+    def get_user_profile(self, user, steam_api_key=None):
+        if user == "broken":
+            raise IOError("no such profile")
+        return StubProfiles.get_user_profile(self, user, steam_api_key)
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = BrokenStubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        self.output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+        shutil.rmtree(self.output)
+
+    def test_renders_to_directory_and_isolates_errors(self):
+        progress = []
+        summary = batch.renderBatch(["alice", "broken", "bob", "alice"], self.output, processes=1,
+                                    progress=lambda *args: progress.append(args))
+        self.assertEqual(summary['rendered'], 4)
+        self.assertEqual([(f[0], f[1]) for f in summary['failed']], [("broken", "card"), ("broken", "sig")])
+        self.assertEqual(sorted(os.listdir(self.output)),
+                         ["alice_card.png", "alice_sig.png", "bob_card.png", "bob_sig.png"])
+        self.assertEqual([p[:2] for p in progress], [(1, 3), (2, 3), (3, 3)])
+        self.assertEqual(self.stub.user_calls, 2)
+
+    def test_in_process_batch_restores_caches(self):
+        sizes = memory.cacheSizes()
+        summary = batch.renderBatch(["alice"], self.output, processes=1, memory_limit=8 * 1024 * 1024,
+                                    cache_dir=os.path.join(self.output, "assets"))
+        self.assertEqual(summary['rendered'], 2)
+        self.assertEqual((image_cache.cache_dir, memory.governor, memory.cacheSizes()), (None, None, sizes))
+
+    def test_renders_to_archive_on_process_pool(self):
+        archive = os.path.join(self.output, "cards.zip")
+        summary = batch.renderBatch(["alice", "bob", "carol"], archive, imgtypes=["sig"], processes=2,
+                                    cache_dir=os.path.join(self.output, "assets"))
+        self.assertEqual((summary['rendered'], summary['failed']), (3, []))
+        with zipfile.ZipFile(archive) as f:
+            names = sorted(f.namelist())
+            self.assertEqual(f.read(names[0])[:4], b"\x89PNG")
+        self.assertEqual(names, ["alice_sig.png", "bob_sig.png", "carol_sig.png"])
+
+    def test_command_line(self):
+        idfile = os.path.join(self.output, "ids.txt")
+        with open(idfile, "w") as f:
+            f.write("# members\nalice\n\nbroken\n")
+        out = os.path.join(self.output, "out")
+        status = batch.main(["-q", "-j", "1", "-t", "card", "-f", idfile, "-o", out, "bob"])
+        self.assertEqual(status, 1)
+        self.assertEqual(sorted(os.listdir(out)), ["alice_card.png", "bob_card.png"])
@@ -0,0 +1,232 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import shutil, tempfile, threading, time
+import unittest
+
+from PIL import Image
+
+from steamprofilecard.cache import LRUCache, ImageCache, ProfileCache, image_cache, profile_cache, render_cache, sprite_cache
+from steamprofilecard import sprites
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used_over_budget(self):
+        cache = LRUCache(max_bytes=10)
+        cache.set("a", 1, 4)
+        cache.set("b", 2, 4)
+        cache.get("a")
+        cache.set("c", 3, 4)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("c"), 3)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (3, 1, 1))
+        self.assertEqual(stats['bytes'], 8)
+
+    def test_order_survives_repeated_use(self):
+        cache = LRUCache(max_bytes=3)
+        for key in "abc":
+            cache.set(key, key, 1)
+        for i in range(500):
+            cache.get("a")
+            cache.get("c")
+        self.assertTrue(len(cache._order) < 100)
+        cache.set("d", "d", 1)
+        self.assertEqual([cache.get(key) for key in "abcd"], ["a", None, "c", "d"])
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(max_bytes=10, ttl=0.05)
+        cache.set("a", 1, 1)
+        time.sleep(0.1)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.size, 0)
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_disk_tier_survives_restart(self):
+        image = Image.new("RGB", (20, 20), color="#FF0000")
+        ImageCache(cache_dir=self.cache_dir).setImage("http://cdn/icon.jpg", (20, 20), image)
+        cache = ImageCache(cache_dir=self.cache_dir)
+        cached = cache.getImage("http://cdn/icon.jpg", (20, 20))
+        self.assertEqual(cached.size, (20, 20))
+        self.assertEqual(cached.getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(cache.getImage("http://cdn/icon.jpg", (55, 55)), None)
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+class TestProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def loader(self, key):
+        self.calls.append(key)
+        time.sleep(0.1)
+        return "%s-%s" % (key, len(self.calls))
+
+    def test_fresh_entries_are_reused(self):
+        cache = ProfileCache(fresh=60)
+        self.assertEqual(cache.get("user", self.loader), "user-1")
+        self.assertEqual(cache.get("user", self.loader), "user-1")
+        self.assertEqual(self.calls, ["user"])
+
+    def test_stale_entries_are_served_while_revalidating(self):
+        cache = ProfileCache(fresh=0.05, stale=60)
+        cache.get("user", self.loader)
+        time.sleep(0.1)
+        self.assertEqual(cache.get("user", self.loader), "user-1")
+        time.sleep(0.3)
+        cache.fresh = 60
+        self.assertEqual(cache.get("user", self.loader), "user-2")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_usable_entries(self):
+        cache = ProfileCache(fresh=0.05, stale=0.05)
+        self.assertFalse(cache.usable("user"))
+        cache.get("user", self.loader)
+        self.assertTrue(cache.usable("user"))
+        time.sleep(0.1)
+        self.assertTrue(cache.age("user") is not None)
+        self.assertFalse(cache.usable("user"))
+
+    def test_concurrent_lookups_are_coalesced(self):
+        cache = ProfileCache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("user", self.loader))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["user-1"] * 8)
+        self.assertEqual(self.calls, ["user"])
+
+    def test_errors_are_not_cached(self):
+        cache = ProfileCache()
+        def failing(key):
+            raise IOError("Steam API unavailable")
+        self.assertRaises(IOError, cache.get, "user", failing)
+        self.assertEqual(cache.get("user", self.loader), "user-1")
+
+class TestCardImageCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        image_cache.clear()
+        render_cache.clear()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_second_render_uses_cache(self):
+        SteamProfileCard("stubuser", "card", "default").drawProfileImg()
+        self.assertEqual(len(self.server.requests), 5)
+        SteamProfileCard("stubuser", "card", "default").drawProfileImg()
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_profiles_are_looked_up_once(self):
+        SteamProfileCard("stubuser", "card", "default")
+        SteamProfileCard("stubuser", "sig", "default")
+        self.assertEqual((self.stub.user_calls, self.stub.group_calls), (1, 1))
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        image_cache.clear()
+        render_cache.clear()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_rendered_png_is_reused(self):
+        data = SteamProfileCard("stubuser", "card", "default").renderToWeb()
+        self.assertEqual(data[:8], b"\x89PNG\r\n\x1a\n")
+        image_cache.clear()
+        profile = SteamProfileCard("stubuser", "card", "default")
+        self.assertEqual(profile.renderToWeb(), data)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertFalse(hasattr(profile, "profileImage"))
+
+    def test_etag_follows_drawn_fields(self):
+        card = SteamProfileCard("stubuser", "card", "default")
+        etag = card.etag()
+        self.assertEqual(SteamProfileCard("stubuser", "card", "default").etag(), etag)
+        self.assertNotEqual(SteamProfileCard("stubuser", "sig", "default").etag(), etag)
+        self.assertTrue(card.notModified(etag))
+        self.assertTrue(card.notModified('W/"other", ' + etag))
+        self.assertFalse(card.notModified('"other"'))
+        self.assertFalse(card.notModified(None))
+        # Cached profiles are copies, a change shows once the profile is looked up again.
+        self.stub.user.personastate = 0
+        self.assertEqual(card.etag(), etag)
+        profile_cache.invalidate("stubuser")
+        self.assertNotEqual(SteamProfileCard("stubuser", "card", "default").etag(), etag)
+
+    def test_private_profiles_are_keyed_by_steamuserid(self):
+        self.stub.user.communityvisibilitystate = 1
+        data = SteamProfileCard("stubuser", "card", "default").renderToWeb()
+        other = SteamProfileCard("76561197960287930", "card", "default")
+        self.assertNotEqual(other.etag(), SteamProfileCard("stubuser", "card", "default").etag())
+        self.assertEqual(other.cachedRender(), None)
+        self.assertNotEqual(other.renderToWeb(), data)
+
+    def test_incomplete_renders_are_not_cached(self):
+        self.stub.user.avatarmedium = self.server.url("avatar.jpg", delay=1000)
+        profile = SteamProfileCard("stubuser", "card", "default", asset_timeout=0.2)
+        etag = profile.etag()
+        profile.renderToWeb()
+        self.assertEqual(len(render_cache), 0)
+        self.assertEqual(profile.etag(), None)
+        self.assertFalse(profile.notModified(etag))
+
+class TestSpriteCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        sprite_cache.clear()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_sprites_are_drawn_once(self):
+        badge = sprites.steamLevel("42")
+        self.assertEqual(badge.size, (29, 29))
+        self.assertTrue(sprites.steamLevel("42") is badge)
+        self.assertFalse(sprites.steamLevel("43") is badge)
+        dot = sprites.onlineState("#00FF00")
+        self.assertTrue(sprites.onlineState("#00FF00") is dot)
+        self.assertEqual(len(sprite_cache), 3)
+
+    def test_renders_reuse_sprites(self):
+        SteamProfileCard("stubuser", "card", "default").drawProfileImg()
+        misses = sprite_cache.stats()['misses']
+        SteamProfileCard("stubuser", "card", "default").drawProfileImg()
+        self.assertEqual(sprite_cache.stats()['misses'], misses)
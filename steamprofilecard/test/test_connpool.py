@@ -0,0 +1,109 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import socket
+import threading
+import time
+import unittest
+
+from steamprofilecard.assets import AssetFetcher
+from steamprofilecard.connpool import ConnectionPool, FetchError
+from steamprofilecard.test.httpstub import StubServer
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.pool = ConnectionPool(max_per_host=2, timeout=2)
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.close()
+
+    def test_connections_are_reused(self):
+        for i in range(5):
+            self.assertEqual(self.pool.get(self.server.url("icon%s.png" % i)), self.server.body)
+        self.assertEqual(self.server.connections, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['created'], stats['reused'], stats['idle'], stats['active']), (1, 4, 1, 0))
+
+    def test_per_host_limit(self):
+        results = []
+        def get(i):
+            results.append(self.pool.get(self.server.url("icon%s.png" % i, delay=200)))
+        threads = [threading.Thread(target=get, args=(i,)) for i in range(6)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Six requests over two connections take three rounds.
+        self.assertTrue(time.time() - start >= 0.55)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_waiting_for_a_connection_times_out(self):
+        pool = ConnectionPool(max_per_host=1)
+        slow = threading.Thread(target=pool.get, args=(self.server.url("slow.png", delay=500),))
+        slow.start()
+        time.sleep(0.1)
+        self.assertRaises(socket.timeout, pool.get, self.server.url("fast.png"), 0.1)
+        slow.join()
+        self.assertEqual(pool.get(self.server.url("fast.png")), self.server.body)
+        pool.clear()
+
+    def test_errors(self):
+        self.assertRaises(FetchError, self.pool.get, self.server.url("missing.png"))
+        self.assertRaises(socket.timeout, self.pool.get, self.server.url("slow.png", delay=1000), 0.2)
+        self.assertRaises(FetchError, ConnectionPool(max_response_bytes=100).get, self.server.url("big.png"))
+        self.assertRaises(FetchError, self.pool.get, "ftp://127.0.0.1/icon.png")
+        # Failed connections are closed, not kept for reuse.
+        self.assertEqual(self.pool.stats()['active'], 0)
+        self.assertEqual(self.pool.get(self.server.url("icon.png")), self.server.body)
+
+    def test_unexpected_errors_free_the_slot(self):
+        pool = ConnectionPool(max_per_host=1)
+        url = self.server.url(u"\u00e9.png")
+        for i in range(2):
+            self.assertRaises(UnicodeError, pool.get, url, 0.5)
+        self.assertEqual(pool.stats()['active'], 0)
+        self.assertEqual(pool.get(self.server.url("icon.png")), self.server.body)
+        pool.clear()
+
+    def test_redirects_are_followed(self):
+        self.assertEqual(self.pool.get(self.server.url("redirect/icon.png")), self.server.body)
+        self.assertEqual(self.server.requests, ["/redirect/icon.png?delay=0", "/icon.png?delay=0"])
+
+    def test_closed_connections_are_replaced(self):
+        self.pool.get(self.server.url("icon.png"))
+        for idle in self.pool._idle.values():
+            for conn, returned in idle:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(self.pool.get(self.server.url("icon.png")), self.server.body)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_fetcher_uses_pool(self):
+        fetcher = AssetFetcher(timeout=2, pool=self.pool)
+        urls = [self.server.url("icon%s.png" % i) for i in range(2)]
+        fetcher.fetch(urls)
+        fetcher.fetch(urls)
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.pool.stats()['reused'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import io
+import unittest
+
+from PIL import Image
+
+from steamprofilecard import encoders
+from steamprofilecard.cache import render_cache
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestEncoders(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        render_cache.clear()
+        self.image = SteamProfileCard("stubuser", "card", "default").drawProfileImg()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_png_matches_pil_default(self):
+        stream = io.BytesIO()
+        self.image.save(stream, "PNG")
+        encoded = encoders.encode(self.image)
+        self.assertEqual(encoded.data, stream.getvalue())
+        self.assertEqual((encoded.mimetype, encoded.size), ("image/png", len(stream.getvalue())))
+        self.assertTrue(encoded.encode_time >= 0)
+        fast = encoders.encode(self.image, "png", compress_level=1)
+        self.assertEqual(Image.open(io.BytesIO(fast.data)).tobytes(), self.image.tobytes())
+
+    def test_palette_png_is_smaller(self):
+        encoded = encoders.encode(self.image, "png-palette", colors=64)
+        self.assertTrue(encoded.size < encoders.encode(self.image).size)
+        self.assertEqual(Image.open(io.BytesIO(encoded.data)).mode, "P")
+
+    def test_webp(self):
+        if not encoders.available("webp"):
+            self.skipTest("Pillow was built without WebP support")
+        encoded = encoders.encode(self.image, "webp-lossless")
+        self.assertEqual(encoded.mimetype, "image/webp")
+        self.assertEqual(Image.open(io.BytesIO(encoded.data)).convert("RGB").tobytes(), self.image.tobytes())
+        self.assertEqual(encoders.encode(self.image, "webp", quality=50).data[8:12], b"WEBP")
+
+    def test_memoryview_and_errors(self):
+        encoded = encoders.encode(self.image, as_memoryview=True)
+        self.assertTrue(isinstance(encoded.data, memoryview))
+        self.assertEqual(encoded.data[:4].tobytes(), b"\x89PNG")
+        self.assertRaises(ValueError, encoders.encode, self.image, "gif")
+
+    def test_profile_encodings(self):
+        profile = SteamProfileCard("stubuser", "sig", "default")
+        png = profile.renderToWeb()
+        palette = profile.renderToWeb("png-palette", colors=32)
+        self.assertNotEqual(png, palette)
+        self.assertEqual(profile.encodedImage.size, len(palette))
+        self.assertEqual(profile.cachedRender("png-palette", colors=32), palette)
+        self.assertEqual(profile.etag("png")[:-1], profile.etag()[:-1])
+        self.assertNotEqual(profile.etag("png-palette", colors=32), profile.etag())
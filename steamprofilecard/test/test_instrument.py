@@ -0,0 +1,191 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from steamprofilecard.cache import ProfileCache, image_cache, render_cache, composition_cache
+from steamprofilecard.instrument import instrumentation, LoggingSink, PrometheusSink, StatsdSink
+from steamprofilecard.resources import ResourceRegistry
+from steamprofilecard.server import ProfileCardApp
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        for cache in (image_cache, render_cache, composition_cache):
+            cache.clear()
+        self.events = []
+        instrumentation.add(self.events.append)
+
+    def tearDown(self):
+        instrumentation.clear()
+        self.stub.uninstall()
+        self.server.close()
+
+    def stages(self, outcome=None):
+        return [event.stage for event in self.events if outcome is None or event.outcome == outcome]
+
+    def test_disabled_is_a_no_op(self):
+        instrumentation.clear()
+        self.assertFalse(instrumentation.enabled())
+        self.assertTrue(instrumentation.stage("encode") is instrumentation.stage("profile"))
+        SteamProfileCard("stubuser", "card", "default").renderToWeb()
+        self.assertEqual(self.events, [])
+
+    def test_render_reports_every_stage(self):
+        data = SteamProfileCard("stubuser", "card", "default").renderToWeb()
+        stages = self.stages("ok")
+        self.assertEqual(stages.count("asset_fetch"), 5)
+        self.assertEqual(stages.count("asset_decode"), 5)
+        for stage in ("profile", "draw_profile", "encode"):
+            self.assertEqual(stages.count(stage), 1)
+        encode = [event for event in self.events if event.stage == "encode"][0]
+        self.assertEqual((encode.nbytes, encode.tags), (len(data), {'imgtype': "card", 'format': "png"}))
+        self.assertTrue(all(event.duration >= 0 for event in self.events))
+
+    def test_failures_are_reported(self):
+        self.stub.user.avatarmedium = "http://127.0.0.1:1/missing.jpg"
+        self.stub.user.recentlyplayedgames[0]['img_icon_url'] = self.server.url("slow.jpg", 2000)
+        profile = SteamProfileCard("stubuser", "card", "default", asset_timeout=0.5)
+        profile.drawProfileImg()
+        self.assertFalse(profile.imageToWeb("bmp"))
+        failed = [(event.stage, event.outcome) for event in self.events if event.outcome != "ok"]
+        self.assertEqual(sorted(failed), [("asset_fetch", "error"), ("asset_fetch", "timeout"), ("encode", "error")])
+        encode = [event for event in self.events if event.stage == "encode"][0]
+        self.assertTrue("Unknown image format" in encode.error)
+
+    def test_profile_errors_are_reported(self):
+        def fail(user, steam_api_key=None):
+            raise IOError("Steam API is down")
+        self.stub.get_user_profile = fail
+        self.stub.install()
+        profile = SteamProfileCard("stubuser", "card", "default")
+        profile.drawProfileImg()
+        self.assertFalse(profile.profileGrabStatus)
+        self.assertEqual([(event.stage, event.outcome) for event in self.events],
+                         [("profile", "error"), ("draw_error", "ok")])
+        self.assertTrue("Steam API is down" in self.events[0].error)
+
+    def test_failed_refreshes_are_reported(self):
+        cache = ProfileCache(fresh=0, stale=60)
+        cache.get("stubuser", lambda key: "profile")
+        def fail(key):
+            raise IOError("Steam API is down")
+        self.assertEqual(cache.get("stubuser", fail), "profile")
+        deadline = time.time() + 1
+        while not self.events and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([(event.stage, event.outcome, event.tags) for event in self.events],
+                         [("profile", "error", {'refresh': "background"})])
+
+    def test_unreadable_templates_are_reported(self):
+        template_path = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(template_path, "card"))
+            with open(os.path.join(template_path, "card", "broken.png"), "wb") as f:
+                f.write(b"not a png")
+            image = ResourceRegistry(template_path=template_path).template("card", "broken", (210, 150))
+        finally:
+            shutil.rmtree(template_path)
+        self.assertEqual(image.getpixel((0, 0)), (128, 128, 128))
+        self.assertEqual([(event.stage, event.outcome) for event in self.events], [("template", "error")])
+
+    def test_failing_sink_is_ignored(self):
+        def broken(event):
+            raise RuntimeError("sink failed")
+        instrumentation.add(broken)
+        logging.getLogger("steamprofilecard.instrument").disabled = True
+        try:
+            self.assertTrue(SteamProfileCard("stubuser", "sig", "default").renderToWeb())
+        finally:
+            logging.getLogger("steamprofilecard.instrument").disabled = False
+        self.assertTrue("encode" in self.stages())
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        for cache in (image_cache, render_cache, composition_cache):
+            cache.clear()
+
+    def tearDown(self):
+        instrumentation.clear()
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_prometheus(self):
+        metrics = PrometheusSink()
+        instrumentation.add(metrics)
+        app = ProfileCardApp(metrics=metrics)
+        SteamProfileCard("stubuser", "card", "default").renderToWeb()
+        responses = []
+        body = b"".join(app({'PATH_INFO': "/metrics", 'REQUEST_METHOD': "GET"},
+                            lambda status, headers: responses.append(status)))
+        text = body.decode("utf-8")
+        self.assertEqual(responses, ["200 OK"])
+        self.assertTrue('steamprofilecard_stage_seconds_count{stage="asset_fetch"} 5' in text, text)
+        self.assertTrue('steamprofilecard_stage_total{stage="encode",outcome="ok"} 1' in text, text)
+        self.assertTrue('steamprofilecard_stage_bytes_total{stage="encode"}' in text, text)
+
+    def test_statsd(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(2)
+        profile = SteamProfileCard("stubuser", "card", "default")
+        sink = StatsdSink("127.0.0.1", receiver.getsockname()[1], prefix="spc")
+        instrumentation.add(sink)
+        try:
+            # Nothing was drawn yet, so encoding fails.
+            profile.imageToWeb()
+            lines = receiver.recv(4096).decode("ascii").split("\n")
+        finally:
+            sink.close()
+            receiver.close()
+        self.assertTrue(lines[0].startswith("spc.encode.duration:") and lines[0].endswith("|ms"), lines)
+        self.assertEqual(lines[1], "spc.encode.error:1|c")
+
+    def test_logging(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger("steamprofilecard.test.instrument")
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        instrumentation.add(LoggingSink(logger))
+        try:
+            SteamProfileCard("stubuser", "sig", "default").renderToWeb()
+        finally:
+            logger.removeHandler(handler)
+        messages = [record.getMessage() for record in records]
+        self.assertTrue(any(message.startswith("encode ") and "format=png" in message for message in messages), messages)
+        self.assertTrue(all(record.levelno == logging.DEBUG for record in records))
+
+if __name__ == '__main__':
+    unittest.main()
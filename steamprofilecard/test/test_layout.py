@@ -0,0 +1,144 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import hashlib, json, os, shutil, tempfile
+import unittest
+
+from PIL import Image
+
+from steamprofilecard.layout import compileLayout, clearLayouts, profileFields
+from steamprofilecard.resources import resources
+from steamprofilecard.test.fixtures import make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.user = make_user(self.server, games=6)
+        self.fields = profileFields(self.user, make_group(self.server))
+        clearLayouts()
+
+    def tearDown(self):
+        self.server.close()
+        clearLayouts()
+
+    def test_layouts_are_compiled_once(self):
+        layout = compileLayout("card", "default", (210, 150))
+        self.assertTrue(compileLayout("card", "default", (210, 150)) is layout)
+        self.assertFalse(compileLayout("sig", "default", (350, 50)) is layout)
+
+    def test_fields(self):
+        self.assertEqual(self.fields['playtime_2weeks'], 32)
+        self.assertEqual(self.fields['game_hours'], 2)
+        self.assertEqual(self.fields['joined'], "September 12, 2003")
+        self.user.recentlyplayedgames[0]['name'] = "A game name longer than twenty five"
+        self.assertEqual(profileFields(self.user, None)['game_name'], "A game name longer than...")
+
+    def test_asset_requests_follow_conditions(self):
+        sig = compileLayout("sig", "default", (350, 50))
+        icons = [(game['img_icon_url'], (20, 20)) for game in self.user.recentlyplayedgames[:5]]
+        self.assertEqual(sig.assetRequests(self.fields),
+                         [(self.user.avatarmedium, (40, 40)), (self.fields['group_icon'], (20, 20))] + icons[::-1])
+        self.fields['group'] = False
+        self.assertEqual(len(sig.assetRequests(self.fields)), 6)
+
+class TestTemplateLayout(unittest.TestCase):
+    def setUp(self):
+        self.template_path = resources.template_path
+        resources.template_path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(resources.template_path, "sig"))
+        elements = [
+            {'type': 'text', 'pos': [5, 5], 'font': 'large', 'text': "Member"},
+            {'type': 'text', 'pos': [5, 25], 'bind': 'personaname'},
+        ]
+        with open(os.path.join(resources.template_path, "sig", "plain.json"), "w") as f:
+            json.dump(elements, f)
+        clearLayouts()
+
+    def tearDown(self):
+        shutil.rmtree(resources.template_path)
+        resources.template_path = self.template_path
+        clearLayouts()
+
+    def test_json_layout_with_static_layer(self):
+        layout = compileLayout("sig", "plain", (350, 50))
+        self.assertEqual(len(layout.elements), 1)
+        image = layout.render({'personaname': "Stub User"}, {})
+        self.assertEqual(image.size, (350, 50))
+        self.assertEqual(image.crop((0, 0, 350, 20)).tobytes(), layout.base.crop((0, 0, 350, 20)).tobytes())
+        self.assertNotEqual(image.crop((0, 25, 350, 50)).tobytes(), layout.base.crop((0, 25, 350, 50)).tobytes())
+
+def fake_assets(layout, fields):
+    """
+    Returns a distinct solid image for every asset the layout asks for.
+    """
+    assets = {}
+    for url, size in layout.assetRequests(fields):
+        color = tuple(bytearray(hashlib.md5(url.encode("utf-8")).digest()[:3]))
+        assets[(url, size)] = Image.new("RGB", size or (32, 32), color=color)
+    return assets
+
+class TestIncrementalRender(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.user = make_user(self.server, games=6)
+        self.group = make_group(self.server)
+
+    def tearDown(self):
+        self.server.close()
+
+    def changes(self):
+        user = self.user
+        yield lambda: setattr(user, 'personastate', 3)
+        yield lambda: user.recentlyplayedgames[0].update(playtime_2weeks=600)
+        yield lambda: setattr(user, 'steamlevel', 7)
+        yield lambda: user.recentlyplayedgames.reverse()
+        yield lambda: user.recentlyplayedgames[0].update(name="Another Game With A Much Longer Name")
+        yield lambda: setattr(user, 'personaname', "Renamed")
+        yield lambda: setattr(self, 'group', None)
+        yield lambda: setattr(user, 'personastate', 0)
+        yield lambda: user.recentlyplayedgames.pop()
+
+    def test_matches_full_render(self):
+        for imgtype, size in (("card", (210, 150)), ("sig", (350, 50))):
+            layout = compileLayout(imgtype, "default", size)
+            fields = profileFields(self.user, self.group)
+            previous = layout.renderIncremental(fields, fake_assets(layout, fields))
+            for change in self.changes():
+                change()
+                fields = profileFields(self.user, self.group)
+                assets = fake_assets(layout, fields)
+                composition = layout.renderIncremental(fields, assets, previous)
+                self.assertEqual(composition.image.tobytes(), layout.render(fields, assets).tobytes())
+                previous = composition
+            self.user = make_user(self.server, games=6)
+            self.group = make_group(self.server)
+
+    def test_only_changed_regions_are_repainted(self):
+        layout = compileLayout("card", "default", (210, 150))
+        fields = profileFields(self.user, self.group)
+        assets = fake_assets(layout, fields)
+        previous = layout.renderIncremental(fields, assets)
+        self.assertTrue(layout.renderIncremental(fields, assets, previous) is previous)
+        # Mark a pixel no element covers; a full render would erase it.
+        previous.image.putpixel((100, 100), (1, 2, 3))
+        fields['personastate'] = "Busy"
+        composition = layout.renderIncremental(fields, assets, previous)
+        self.assertEqual(composition.image.getpixel((100, 100)), (1, 2, 3))
+        self.assertEqual(composition.image.getpixel((67, 42)), layout.render(fields, assets).getpixel((67, 42)))
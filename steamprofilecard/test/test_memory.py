@@ -0,0 +1,122 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import threading
+import time
+import unittest
+
+from steamprofilecard import memory
+from steamprofilecard.cache import LRUCache, image_cache, profile_cache, render_cache, composition_cache
+from steamprofilecard.layout import profileFields
+from steamprofilecard.records import ProfileRecord, GroupRecord
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_records_hold_what_is_drawn(self):
+        record = ProfileRecord.fromUser(self.stub.user)
+        group = GroupRecord.fromGroup(self.stub.group)
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(profileFields(record, group), profileFields(self.stub.user, self.stub.group))
+        game = record.recentlyplayedgames[0]
+        self.assertEqual((game['name'], game.get('appid'), game.get('missing', 1)), ("Stub Game 0", None, 1))
+        self.assertRaises(KeyError, lambda: game['appid'])
+
+    def test_profile_cache_keeps_records(self):
+        profile = SteamProfileCard("stubuser", "card", "default")
+        self.assertTrue(isinstance(profile.user_profile, ProfileRecord))
+        self.assertTrue(isinstance(profile.primary_group_profile, GroupRecord))
+        self.assertEqual(profile.user_profile.personastate, "Online")
+        self.stub.group = None
+        profile_cache.clear()
+        self.assertEqual(SteamProfileCard("stubuser", "card", "default").primary_group_profile, None)
+
+    def test_drawn_image_is_released(self):
+        profile = SteamProfileCard("stubuser", "card", "default")
+        self.assertTrue(profile.renderToWeb())
+        self.assertFalse(hasattr(profile, "profileImage"))
+
+class TestMemoryGovernor(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        self.saved = [(cache, cache.max_bytes) for cache in (image_cache, render_cache, composition_cache)]
+        self.saved_profiles = profile_cache._entries.max_bytes
+
+    def tearDown(self):
+        memory.uninstall()
+        for cache, max_bytes in self.saved:
+            cache.resize(max_bytes)
+        profile_cache.resize(self.saved_profiles)
+        self.stub.uninstall()
+        self.server.close()
+
+    def test_budgets_resize_caches(self):
+        cache = LRUCache(100)
+        cache.set("a", 1, 60)
+        cache.set("b", 2, 30)
+        cache.resize(50)
+        self.assertEqual((cache.get("a"), cache.get("b")), (None, 2))
+
+        governor = memory.MemoryGovernor(10 * 1024 * 1024)
+        memory.install(governor)
+        budgets = governor.budgets()
+        self.assertEqual(image_cache.max_bytes, budgets['image_cache'])
+        self.assertEqual(render_cache.max_bytes, 2 * 1024 * 1024)
+        self.assertEqual(profile_cache._entries.max_bytes, 409)
+        self.assertEqual(governor.max_renders, 2)
+        total = sum(budgets.values()) - budgets['profile_cache'] + 409 * memory.PROFILE_BYTES
+        self.assertTrue(total + governor.max_renders * memory.RENDER_BYTES <= governor.limit)
+        stats = governor.stats()
+        self.assertEqual((stats['limit'], stats['in_flight']), (governor.limit, 0))
+
+    def test_renders_in_flight_are_bounded(self):
+        governor = memory.MemoryGovernor(1024 * 1024)
+        memory.install(governor)
+        self.assertEqual(governor.max_renders, 1)
+        peak = []
+        def hold():
+            with governor.renderSlot():
+                peak.append(governor.in_flight)
+                time.sleep(0.1)
+        threads = [threading.Thread(target=hold) for i in range(3)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak, [1, 1, 1])
+        self.assertTrue(time.time() - start >= 0.3)
+        render_cache.clear()
+        self.assertTrue(SteamProfileCard("stubuser", "sig", "default").renderToWeb())
+        self.assertEqual(governor.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import unittest
+
+from steamprofilecard.resources import ResourceRegistry
+
+class TestResourceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ResourceRegistry()
+
+    def test_fonts_load_lazily_once(self):
+        self.assertEqual(self.registry._fonts, {})
+        font = self.registry.font("small")
+        self.assertTrue(self.registry.font("small") is font)
+        self.assertEqual(list(self.registry._fonts), ["small"])
+
+    def test_templates_are_copied_from_memory(self):
+        first = self.registry.template("card", "default", (210, 150))
+        self.assertEqual(first.mode, "RGB")
+        first.paste((0, 0, 0), (0, 0, 210, 150))
+        second = self.registry.template("card", "default", (210, 150))
+        self.assertNotEqual(second.getpixel((100, 100)), (0, 0, 0))
+        self.assertEqual(len(self.registry._templates), 1)
+
+    def test_missing_or_wrong_size_templates_fall_back_to_gray(self):
+        for template, size in (("missing", (210, 150)), ("default", (350, 50))):
+            image = self.registry.template("card", template, size)
+            self.assertEqual(image.size, size)
+            self.assertEqual(image.getpixel((0, 0)), (128, 128, 128))
+        self.assertEqual(self.registry._templates, {})
@@ -0,0 +1,146 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import time
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+from steamprofilecard.cache import image_cache, render_cache, composition_cache
+from steamprofilecard.scheduler import RefreshScheduler
+from steamprofilecard.server import ProfileCardApp
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestRefreshScheduler(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        for cache in (image_cache, render_cache, composition_cache):
+            cache.clear()
+        self.scheduler = RefreshScheduler(jitter=0)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.stub.uninstall()
+        self.server.close()
+
+    def stored(self, imgtype="card"):
+        return self.scheduler.store.getRender(imgtype, "stubuser")
+
+    def test_renders_watched_profiles(self):
+        self.scheduler.watch("stubuser")
+        self.assertEqual(self.scheduler.watching(), ["stubuser"])
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.stub.user_calls, 1)
+        for imgtype in ("card", "sig"):
+            etag, data, format, expires = self.stored(imgtype)
+            self.assertEqual((data[:4], format), (b"\x89PNG", "png"))
+            # The stub user is online.
+            self.assertTrue(55 < expires - time.time() <= 60)
+        # Nothing is due until the interval has passed.
+        self.assertEqual(self.scheduler.run_pending(), 0)
+        self.assertEqual(self.scheduler.run_pending(time.time() + 61), 1)
+        self.assertEqual(self.stub.user_calls, 2)
+
+    def test_interval_follows_state(self):
+        self.stub.user.personastate = 0
+        self.scheduler.watch("stubuser")
+        self.scheduler.run_pending()
+        self.assertTrue(self.stored()[3] - time.time() > 1700)
+        self.assertEqual(self.scheduler.run_pending(time.time() + 600), 0)
+
+        self.stub.user.communityvisibilitystate = 1
+        self.scheduler.run_pending(time.time() + 1801)
+        self.assertTrue(self.stored()[3] - time.time() > 3500)
+
+    def test_failed_lookup_keeps_images(self):
+        self.scheduler.watch("stubuser")
+        self.scheduler.run_pending()
+        before = self.stored()
+        def fail(user, steam_api_key=None):
+            raise IOError("Steam API is down")
+        self.stub.get_user_profile = fail
+        self.stub.install()
+        self.assertEqual(self.scheduler.run_pending(time.time() + 61), 1)
+        self.assertTrue(self.stored() is before)
+        # The profile is retried after the error interval, not the online one.
+        self.assertEqual(self.scheduler.run_pending(time.time() + 200), 0)
+        self.assertEqual(self.scheduler.run_pending(time.time() + 301), 1)
+
+    def test_unwatch(self):
+        self.scheduler.watch("stubuser")
+        self.scheduler.run_pending()
+        self.scheduler.unwatch("stubuser")
+        self.assertEqual((self.scheduler.watching(), self.stored()), ([], None))
+        self.assertEqual(self.scheduler.run_pending(time.time() + 3600), 0)
+
+    def test_background_threads(self):
+        self.scheduler.watch("stubuser")
+        self.scheduler.start(workers=2, poll=0.05)
+        deadline = time.time() + 5
+        while self.stored("sig") is None and time.time() < deadline:
+            time.sleep(0.05)
+        self.scheduler.stop()
+        self.assertTrue(self.stored("sig") is not None)
+        self.assertEqual(self.stub.user_calls, 1)
+
+    def test_server_serves_from_store(self):
+        self.scheduler.watch("stubuser")
+        self.scheduler.run_pending()
+        app = ProfileCardApp(store=self.scheduler.store)
+        def request(path, **headers):
+            environ = {'PATH_INFO': path}
+            environ.update(headers)
+            setup_testing_defaults(environ)
+            response = {}
+            def start_response(status, headers):
+                response['status'] = status
+                response['headers'] = dict(headers)
+            response['body'] = b"".join(app(environ, start_response))
+            return response
+        render_cache.clear()
+        response = request("/sig/stubuser.png")
+        etag, data, format, expires = self.stored("sig")
+        self.assertEqual((response['status'], response['body'], response['headers']['ETag']), ("200 OK", data, etag))
+        response = request("/sig/stubuser.png", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['status'], "304 Not Modified")
+        self.assertEqual((self.stub.user_calls, len(render_cache)), (1, 0))
+
+    def test_images_missing_assets_have_no_etag(self):
+        self.stub.user.avatarmedium = self.server.url("missing.jpg")
+        self.scheduler.watch("stubuser")
+        self.scheduler.run_pending()
+        etag, data, format, expires = self.stored()
+        self.assertEqual(etag, None)
+        self.assertTrue(expires - time.time() <= 300)
+        app = ProfileCardApp(store=self.scheduler.store)
+        environ = {'PATH_INFO': "/card/stubuser.png"}
+        setup_testing_defaults(environ)
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        body = b"".join(app(environ, start_response))
+        self.assertEqual((response['status'], body), ("200 OK", data))
+        self.assertEqual(response['headers']['Cache-Control'], "no-cache")
+        self.assertFalse('ETag' in response['headers'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+from steamprofilecard.cache import image_cache, profile_cache, render_cache
+from steamprofilecard.server import ProfileCardApp
+from steamprofilecard.sources import RecordingSource
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+class TestProfileCardApp(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        image_cache.clear()
+        render_cache.clear()
+        self.app = ProfileCardApp(render_workers=1, fetch_workers=1, queue_timeout=0.05)
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+
+    def request(self, path, **headers):
+        environ = {'PATH_INFO': path}
+        environ.update(headers)
+        setup_testing_defaults(environ)
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        response['body'] = b"".join(self.app(environ, start_response))
+        return response
+
+    def test_serves_png_with_cache_headers(self):
+        response = self.request("/card/stubuser.png")
+        self.assertEqual(response['status'], "200 OK")
+        self.assertEqual(response['headers']['Content-Type'], "image/png")
+        self.assertEqual(response['body'][:4], b"\x89PNG")
+        self.assertTrue(response['headers']['Cache-Control'] in ("public, max-age=59", "public, max-age=60"))
+        etag = response['headers']['ETag']
+        response = self.request("/card/stubuser.png", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response['status'], response['body']), ("304 Not Modified", b""))
+        self.assertEqual(self.request("/sig/stubuser.png")['status'], "200 OK")
+
+    def test_expired_profiles_need_a_fetch_slot(self):
+        self.request("/card/stubuser.png")
+        fresh, stale = profile_cache.fresh, profile_cache.stale
+        self.app.fetch_slots.acquire()
+        try:
+            self.assertEqual(self.request("/card/stubuser.png")['status'], "200 OK")
+            profile_cache.fresh = profile_cache.stale = 0
+            response = self.request("/card/stubuser.png")
+            self.assertTrue('Warning' in response['headers'])
+            self.assertEqual(self.stub.user_calls, 1)
+        finally:
+            profile_cache.fresh, profile_cache.stale = fresh, stale
+            self.app.fetch_slots.release()
+
+    def test_recording_always_needs_a_fetch_slot(self):
+        self.request("/card/stubuser.png")
+        self.app.source = RecordingSource("unused.zip")
+        self.app.fetch_slots.acquire()
+        try:
+            response = self.request("/card/stubuser.png")
+            self.assertTrue('Warning' in response['headers'])
+            self.assertEqual(self.stub.user_calls, 1)
+        finally:
+            self.app.fetch_slots.release()
+
+    def test_images_missing_assets_are_not_cached(self):
+        self.stub.user.avatarmedium = self.server.url("missing.jpg")
+        response = self.request("/card/stubuser.png")
+        self.assertEqual(response['status'], "200 OK")
+        self.assertEqual(response['headers']['Cache-Control'], "no-cache")
+        self.assertFalse('ETag' in response['headers'])
+        self.app.render_slots.acquire()
+        try:
+            response = self.request("/card/stubuser.png")
+            self.assertEqual(response['status'], "200 OK")
+            self.assertFalse('ETag' in response['headers'])
+        finally:
+            self.app.render_slots.release()
+
+    def test_encoding_per_imgtype(self):
+        self.app.encodings = {'sig': ("png-palette", {'colors': 64})}
+        card = self.request("/card/stubuser.png")
+        sig = self.request("/sig/stubuser.png")
+        self.assertEqual(sig['headers']['Content-Type'], "image/png")
+        self.assertEqual(sig['body'][:4], b"\x89PNG")
+        self.assertNotEqual(sig['headers']['ETag'], card['headers']['ETag'])
+
+    def test_unknown_paths_and_methods(self):
+        self.assertEqual(self.request("/avatar/stubuser.png")['status'], "404 Not Found")
+        self.assertEqual(self.request("/card/../x.png")['status'], "404 Not Found")
+        self.assertEqual(self.request("/card/stubuser.png", REQUEST_METHOD="POST")['status'], "405 Method Not Allowed")
+
+    def test_full_queue_answers_fast(self):
+        self.app.render_slots.acquire()
+        try:
+            response = self.request("/card/stubuser.png")
+            self.assertEqual(response['status'], "503 Service Unavailable")
+            self.app.render_slots.release()
+            first = self.request("/card/stubuser.png")
+            self.app.render_slots.acquire()
+            self.stub.user.personastate = 0
+            profile_cache.invalidate("stubuser")
+            response = self.request("/card/stubuser.png")
+            self.assertEqual(response['status'], "200 OK")
+            self.assertEqual(response['body'], first['body'])
+            self.assertTrue('Warning' in response['headers'])
+        finally:
+            self.app.render_slots.release()
@@ -0,0 +1,128 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from steamprofilecard.batch import renderBatch
+from steamprofilecard.cache import image_cache, profile_cache, render_cache, composition_cache
+from steamprofilecard.sources import RecordingSource, ReplaySource, ReplayError, assetName
+from steamprofilecard.steamprofilecard import SteamProfileCard
+from steamprofilecard.test.fixtures import StubProfiles, make_user, make_group
+from steamprofilecard.test.httpstub import StubServer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks", "fixtures")
+
+def clearCaches():
+    for cache in (image_cache, render_cache, composition_cache):
+        cache.clear()
+    profile_cache.clear()
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmpdir, "fixtures.zip")
+        self.server = StubServer()
+        self.stub = StubProfiles(make_user(self.server), make_group(self.server))
+        self.stub.install()
+        clearCaches()
+        recorder = RecordingSource(self.archive)
+        self.recorded = SteamProfileCard("stubuser", "card", "default", source=recorder).renderToWeb()
+        recorder.save()
+        self.connections = self.server.connections
+        clearCaches()
+
+    def tearDown(self):
+        self.stub.uninstall()
+        self.server.close()
+        clearCaches()
+        shutil.rmtree(self.tmpdir)
+
+    def test_asset_name(self):
+        self.assertEqual(assetName("http://127.0.0.1:80/game0.jpg?delay=0"), "game0.jpg")
+        self.assertEqual(assetName("https://cdn/avatars/98/986a_medium.jpg"), "986a_medium.jpg")
+
+    def test_replay_renders_recording(self):
+        source = ReplaySource(self.archive)
+        self.assertEqual(sorted(source.assets), ["avatar.jpg", "game0.jpg", "game1.jpg", "game2.jpg", "group.jpg"])
+        profile = SteamProfileCard("stubuser", "card", "default", source=source)
+        self.assertEqual(profile.user_profile.personastate, "Online")
+        self.assertEqual(profile.primary_group_profile.groupname, "Stub Group")
+        self.assertEqual(profile.renderToWeb(), self.recorded)
+        self.assertEqual(self.stub.user_calls, 1)
+        self.assertEqual(self.server.connections, self.connections)
+
+    def test_recording_skips_caches(self):
+        SteamProfileCard("stubuser", "card", "default").renderToWeb()
+        cached = (profile_cache.stats()['entries'], len(image_cache), len(render_cache))
+        recorder = RecordingSource(os.path.join(self.tmpdir, "warm.zip"))
+        self.assertEqual(SteamProfileCard("stubuser", "card", "default", source=recorder).renderToWeb(), self.recorded)
+        recorder.save()
+        self.assertEqual((profile_cache.stats()['entries'], len(image_cache), len(render_cache)), cached)
+        source = ReplaySource(recorder.path)
+        self.assertEqual(sorted(source.users), ["stubuser"])
+        self.assertEqual(len(source.assets), 5)
+
+    def test_missing_profile(self):
+        source = ReplaySource(self.archive)
+        self.assertRaises(ReplayError, source.getUserProfile, "nobody")
+        self.assertEqual(SteamProfileCard("nobody", "card", "default", source=source).profileGrabStatus, False)
+
+    def test_latency_and_timeout(self):
+        source = ReplaySource(self.archive, latency=0.05, asset_latency=1)
+        profile = SteamProfileCard("stubuser", "sig", "default", asset_timeout=0.1, source=source)
+        self.assertTrue(profile.profileGrabStatus)
+        self.assertTrue(profile.drawProfileImg())
+        self.assertFalse(profile.assetsComplete)
+
+    def test_error_injection(self):
+        source = ReplaySource(self.archive, error_rate=1, asset_error_rate=0)
+        self.assertEqual(SteamProfileCard("stubuser", "card", "default", source=source).profileGrabStatus, False)
+        source = ReplaySource(self.archive, asset_error_rate=0.5, seed=1)
+        failed = 0
+        for i in range(100):
+            try:
+                source.getAsset("http://cdn/avatar.jpg", 1)
+            except ReplayError:
+                failed += 1
+        self.assertTrue(30 < failed < 70)
+
+    def test_batch_workers(self):
+        source = pickle.loads(pickle.dumps(ReplaySource(self.archive)))
+        output = os.path.join(self.tmpdir, "out")
+        summary = renderBatch(["stubuser", "nobody"], output, ["card"], processes=2, source=source)
+        self.assertEqual(summary['rendered'], 1)
+        self.assertEqual([(steamuserid, imgtype) for steamuserid, imgtype, error in summary['failed']],
+                         [("nobody", "card")])
+
+    def test_benchmark_fixtures(self):
+        if not os.path.isdir(FIXTURES):
+            self.skipTest("benchmarks/fixtures not found")
+        source = ReplaySource(FIXTURES)
+        for steamuserid in sorted(source.users):
+            profile = SteamProfileCard(steamuserid, "card", "default", source=source)
+            self.assertTrue(profile.profileGrabStatus)
+            self.assertTrue(profile.renderToWeb())
+            self.assertTrue(profile.assetsComplete)
+
+if __name__ == '__main__':
+    unittest.main()
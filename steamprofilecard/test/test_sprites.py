@@ -0,0 +1,69 @@
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Copyright (C) 2011-2015  Shawn Silva
+# ------------------------------------
+# This file is part of SteamProfileCard
+#
+# SteamProfileCard is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+import unittest
+
+from PIL import Image, ImageDraw, ImageChops
+
+from steamprofilecard import sprites
+from steamprofilecard.cache import text_cache
+from steamprofilecard.resources import resources
+
+class TestTextMasks(unittest.TestCase):
+    def setUp(self):
+        text_cache.clear()
+
+    def tearDown(self):
+        text_cache.max_bytes = 4 * 1024 * 1024
+        text_cache.clear()
+
+    def test_matches_imagedraw(self):
+        for name in ("small", "large"):
+            font = resources.font(name)
+            for text, fill in (("Steam Level: 42", "#FFFFFF"), ('"Stub Group" Member', "#FF8800"), (u"Jöined", "#00FF00")):
+                expected = Image.new("RGB", (210, 150), "#202020")
+                ImageDraw.Draw(expected).text((-3, 140), text, fill=fill, font=font)
+                image = Image.new("RGB", (210, 150), "#202020")
+                sprites.drawText(image, (-3, 140), text, font, fill)
+                self.assertEqual(ImageChops.difference(expected, image).getbbox(), None, text)
+
+    def test_masks_are_cached_per_string_and_font(self):
+        small, large = resources.font("small"), resources.font("large")
+        image = Image.new("RGB", (210, 150))
+        before = text_cache.stats()
+        for fill in ("#FFFFFF", "#FF0000"):
+            sprites.drawText(image, (5, 5), "Played: 3 hrs past 2 weeks", small, fill)
+        sprites.drawText(image, (5, 5), "Played: 3 hrs past 2 weeks", large)
+        stats = text_cache.stats()
+        self.assertEqual((stats['hits'] - before['hits'], stats['misses'] - before['misses'], stats['entries']), (1, 2, 2))
+        self.assertTrue(sprites.textMask("Played: 3 hrs past 2 weeks", small)[0] is
+                        sprites.textMask("Played: 3 hrs past 2 weeks", small)[0])
+        self.assertEqual(sprites.textMask("", small), None)
+
+    def test_memory_is_bounded(self):
+        text_cache.max_bytes = 2000
+        evictions = text_cache.stats()['evictions']
+        font = resources.font("small")
+        for level in range(100):
+            sprites.textMask("Steam Level: %d" % level, font)
+        self.assertTrue(text_cache.stats()['bytes'] <= 2000)
+        self.assertTrue(text_cache.stats()['evictions'] > evictions)
+
+if __name__ == '__main__':
+    unittest.main()